@@ -0,0 +1,203 @@
+import os
+import sys
+import json
+import argparse
+from datetime import datetime
+
+from pyomo.environ import Var, Constraint, value
+
+from solve_subproblems import solve_day
+from candidate_days import compute_candidate_days
+from solvers import solver_backends, get_solver_settings, solve_model
+from solve_master import build_master_with_milp, solve_master_with_constrained_asp, solve_master_with_rolling_horizon
+from instance_runner import get_folder_path, get_instance_paths, run_on_instances
+
+# total priority of the packets scheduled in a day
+def get_daily_value(day_name, priorities, requests, daily_results):
+    daily_value = 0
+    for patient_name, patient in requests[day_name].items():
+        not_scheduled_packet_names = daily_results["notScheduledPackets"].get(patient_name, [])
+        for packet_name in patient["packets"]:
+            if packet_name not in not_scheduled_packet_names:
+                daily_value += priorities[patient_name]
+    return daily_value
+
+# solve every day of the requests with and without symmetry breaking, timing each day separately
+def benchmark_symmetry(services, packets, operators, priorities, requests, method, solver):
+    days = dict()
+    for day_name in requests.keys():
+        days[day_name] = dict()
+        for label, symmetry_breaking in (("plain", False), ("symmetry", True)):
+            start_time = datetime.now()
+            daily_results = solve_day(day_name, services, packets, operators, priorities, requests, method, symmetry_breaking=symmetry_breaking, solver=solver)
+            end_time = datetime.now()
+            days[day_name][label] = {
+                "time": (end_time - start_time).total_seconds(),
+                "value": get_daily_value(day_name, priorities, requests, daily_results)
+            }
+    summary = dict()
+    for label in ("plain", "symmetry"):
+        summary[label] = {
+            "time": sum(day[label]["time"] for day in days.values()),
+            "value": sum(day[label]["value"] for day in days.values())
+        }
+    return {
+        "mode": "symmetry",
+        "method": method,
+        "summary": summary,
+        "days": days
+    }
+
+# number of windows with a packet assigned in one of their days (requests days can be numbers or strings)
+def count_done_windows(windows, requests):
+    requests = {f"{day_name}": patients for day_name, patients in requests.items()}
+    done_window_number = 0
+    for window in windows:
+        for day_name in window["days"]:
+            patient = requests.get(f"{day_name}", dict()).get(window["patient"])
+            if patient is not None and window["packet"] in patient["packets"]:
+                done_window_number += 1
+                break
+    return done_window_number
+
+# model size and times of the MILP master and of the constrained ASP master (stopped after time_limit seconds)
+def benchmark_master(full_input, solver, time_limit):
+    candidate_days = compute_candidate_days(full_input)
+    start_time = datetime.now()
+    model = build_master_with_milp(full_input, candidate_days)
+    build_end_time = datetime.now()
+    outcome = solve_model(model, solver)
+    solve_end_time = datetime.now()
+    milp = {
+        "variables": sum(1 for _ in model.component_data_objects(Var)),
+        "constraints": sum(1 for _ in model.component_data_objects(Constraint, active=True)),
+        "buildTime": (build_end_time - start_time).total_seconds(),
+        "solvingTime": (solve_end_time - build_end_time).total_seconds(),
+        "value": round(value(model.objective)),
+        "outcome": outcome
+    }
+
+    asp = dict()
+    requests = solve_master_with_constrained_asp(full_input, asp, time_limit, candidate_days)
+    asp["value"] = count_done_windows(candidate_days["windows"], requests)
+
+    return {
+        "mode": "master",
+        "solver": solver,
+        "timeLimit": time_limit,
+        "milp": milp,
+        "asp": asp
+    }
+
+# value and times of the rolling-horizon MILP master, and its gap from the monolithic one
+# (solved only if the horizon has at most max_monolithic_horizon days)
+def benchmark_rolling(full_input, solver, window_length, overlap, max_monolithic_horizon):
+    candidate_days = compute_candidate_days(full_input)
+
+    start_time = datetime.now()
+    requests, ranges = solve_master_with_rolling_horizon(full_input, window_length, overlap, solver, candidate_days)
+    end_time = datetime.now()
+    rolling = {
+        "time": (end_time - start_time).total_seconds(),
+        "value": count_done_windows(candidate_days["windows"], requests),
+        "ranges": ranges
+    }
+
+    monolithic = None
+    gap = None
+    if full_input['horizon'] <= max_monolithic_horizon:
+        start_time = datetime.now()
+        model = build_master_with_milp(full_input, candidate_days)
+        outcome = solve_model(model, solver)
+        end_time = datetime.now()
+        monolithic = {
+            "time": (end_time - start_time).total_seconds(),
+            "value": round(value(model.objective)),
+            "outcome": outcome
+        }
+        if monolithic["value"] > 0:
+            gap = (monolithic["value"] - rolling["value"]) / monolithic["value"]
+
+    return {
+        "mode": "rolling",
+        "solver": solver,
+        "windowLength": window_length,
+        "overlap": overlap,
+        "rolling": rolling,
+        "monolithic": monolithic,
+        "gap": gap
+    }
+
+def process_instance(instance_path, args):
+    solver = get_solver_settings(args.solver, args.solver_time_limit, args.mip_gap, args.threads)
+    if args.mode in ("master", "rolling"):
+        with open(os.path.join(instance_path, "full_input.json"), "r") as f:
+            full_input = json.load(f)
+        start_time = datetime.now()
+        if args.mode == "master":
+            report = benchmark_master(full_input, solver, args.time_limit)
+        else:
+            report = benchmark_rolling(full_input, solver, args.rolling_horizon, args.rolling_overlap, args.max_monolithic_horizon)
+    else:
+        with open(os.path.join(instance_path, "services.json"), "r") as f:
+            services = json.load(f)
+        with open(os.path.join(instance_path, "packets.json"), "r") as f:
+            packets = json.load(f)
+        with open(os.path.join(instance_path, "operators.json"), "r") as f:
+            operators = json.load(f)
+        with open(os.path.join(instance_path, "priorities.json"), "r") as f:
+            priorities = json.load(f)
+        with open(os.path.join(instance_path, "requests.json"), "r") as f:
+            requests = json.load(f)
+        start_time = datetime.now()
+        report = benchmark_symmetry(services, packets, operators, priorities, requests, args.method, solver)
+    end_time = datetime.now()
+    with open(os.path.join(instance_path, f"benchmark_{args.mode}.json"), "w") as f:
+        json.dump(report, f, indent=4)
+    if args.verbose and args.jobs <= 1:
+        if args.mode == "master":
+            print(f"(milp: {report['milp']['variables']} variables, {report['milp']['constraints']} constraints, "
+                f"{report['milp']['buildTime'] + report['milp']['solvingTime']}s, value {report['milp']['value']}{'' if report['milp']['outcome']['status'] == 'optimal' else ', not optimal'}) "
+                f"(asp: {report['asp']['atoms']} atoms, {report['asp']['rules']} rules, "
+                f"{report['asp']['groundingTime'] + report['asp']['solvingTime']}s, value {report['asp']['value']}{'' if report['asp']['exhausted'] else ', not optimal'})", end=" ")
+        elif args.mode == "rolling":
+            print(f"(rolling: {len(report['rolling']['ranges'])} ranges, {report['rolling']['time']}s, value {report['rolling']['value']})", end=" ")
+            if report["monolithic"] is not None:
+                print(f"(monolithic: {report['monolithic']['time']}s, value {report['monolithic']['value']}, gap {report['gap']})", end=" ")
+        else:
+            for label, entry in report["summary"].items():
+                print(f"({label}: {entry['time']}s, value {entry['value']})", end=" ")
+    return (end_time - start_time).total_seconds()
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Compare the solution times of different options on the instances")
+    parser.add_argument("--mode", metavar="MOD", type=str, default="symmetry", choices=["symmetry", "master", "rolling"], help="what is compared (symmetry|master|rolling)")
+    parser.add_argument("-m", "--method", metavar="MET", type=str, default="asp", choices=["asp", "milp_basic", "milp_optimized", "milp_epsilon", "milp_timeindexed"], help="subproblem solution method used (asp|milp_basic|milp_optimized|milp_epsilon|milp_timeindexed)")
+    parser.add_argument("-s", "--solver", metavar="SOL", type=str, default="gurobi", choices=list(solver_backends.keys()), help="MILP solver used (gurobi|highs|cbc)")
+    parser.add_argument("--solver-time-limit", metavar="SEC", type=float, default=None, help="stop each MILP solve after these many seconds, keeping the best solution found")
+    parser.add_argument("--mip-gap", metavar="GAP", type=float, default=None, help="relative gap at which the MILP solves stop")
+    parser.add_argument("--threads", metavar="NUM", type=int, default=None, help="threads used by the MILP solver")
+    parser.add_argument("--time-limit", metavar="SEC", type=float, default=60, help="time limit of the ASP master search")
+    parser.add_argument("--rolling-horizon", metavar="DAYS", type=int, default=30, help="days of each range of the rolling-horizon master")
+    parser.add_argument("--rolling-overlap", metavar="DAYS", type=int, default=7, help="days of each range solved again with the next one")
+    parser.add_argument("--max-monolithic-horizon", metavar="DAYS", type=int, default=120, help="the monolithic master is solved only on horizons up to these many days")
+    parser.add_argument("-i", "--input", metavar="IN", type=str, default="instances", help="input folder with the instances")
+    parser.add_argument("-j", "--jobs", metavar="NUM", type=int, default=1, help="number of instances processed in parallel")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show what is done")
+    args = parser.parse_args(sys.argv[1:])
+
+    if args.rolling_overlap < 0 or args.rolling_overlap >= args.rolling_horizon:
+        parser.error("--rolling-overlap must be at least 0 and less than --rolling-horizon")
+
+    instance_paths = get_instance_paths(get_folder_path(sys.argv[0], args.input))
+
+    instance_number = len(instance_paths)
+    if instance_number == 0:
+        print("No instance folder found. No action taken.")
+        exit(0)
+
+    total_time = run_on_instances(process_instance, instance_paths, args)
+
+    if args.verbose:
+        print(f"Benchmarked {instance_number} instance(s). Total time taken: {total_time}s, average: {total_time / instance_number}s")
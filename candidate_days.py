@@ -0,0 +1,269 @@
+import os
+import json
+import hashlib
+from bisect import bisect_left, bisect_right
+
+# hash of the whole master input, the key of the cached candidate days
+def get_input_key(full_input):
+    return hashlib.sha256(json.dumps(full_input, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+# Presolve of the master. Each protocol window becomes a record with the days in which its packet can be assigned
+# (the capacity of each care unit must fit every service of the packet). Then the assignments forced to 0 are propagated
+# to a fixpoint through indexes: a service needing another one that cannot be done in the required range cannot be done
+# either, packets containing a service that cannot be done are not assignable, and windows left without days are removed.
+# Capacity constraints that no assignment can violate are dropped too. Returns the data to build the models, with the
+# candidate (patient, packet, day, window) tuples and the counts of the variables and constraints eliminated
+def compute_candidate_days(full_input):
+    care_units_touched_by_packet = dict()
+    for packet_name, packet in full_input['abstract_packet'].items():
+        care_units = set()
+        for service_name in packet:
+            care_units.add(full_input['services'][service_name]['careUnit'])
+        care_units_touched_by_packet[packet_name] = care_units
+
+    # (patient, packet, protocol, iteration, first day, last day) -> window record
+    windows = dict()
+    x_indexes = set()
+    l_indexes = set()
+
+    for patient_name, patient in full_input['pat_request'].items():
+        for protocol_name, protocol in patient.items():
+            if protocol_name == "priority_weight":
+                continue
+            for iteration_name, iteration in protocol.items():
+                initial_offset = iteration[1]
+                for protocol_packet in iteration[0]:
+                    packet_name = protocol_packet['packet_id']
+                    for perfect_day in range(protocol_packet['start_date'] + initial_offset, protocol_packet['existence'][1] + initial_offset + 1, protocol_packet['freq']):
+                        if perfect_day < protocol_packet['existence'][0] or perfect_day > protocol_packet['existence'][1]:
+                            continue
+                        day_names = []
+                        for day_name in range(perfect_day - protocol_packet['tolerance'], perfect_day + protocol_packet['tolerance'] + 1):
+                            if day_name >= full_input['horizon']:
+                                continue
+                            if day_name < protocol_packet['existence'][0] or day_name > protocol_packet['existence'][1]:
+                                continue
+                            if any(full_input['services'][service_name]['duration'] > full_input['capacity'][str(day_name)][full_input['services'][service_name]['careUnit']]
+                                    for service_name in full_input['abstract_packet'][packet_name]):
+                                continue
+                            x_indexes.add((patient_name, packet_name, day_name))
+                            for service_name in full_input['abstract_packet'][packet_name]:
+                                l_indexes.add((patient_name, service_name, day_name))
+                            day_names.append(day_name)
+                        if len(day_names) > 0:
+                            windows[patient_name, packet_name, protocol_name, iteration_name, day_names[0], day_names[-1]] = {
+                                "patient": patient_name,
+                                "packet": packet_name,
+                                "protocol": protocol_name,
+                                "iteration": iteration_name,
+                                "days": day_names
+                            }
+    windows = [windows[key] for key in sorted(windows.keys())]
+
+    # (patient, service) -> sorted days in which the service can be done
+    l_days = dict()
+    for patient_name, service_name, day_name in l_indexes:
+        if (patient_name, service_name) not in l_days:
+            l_days[patient_name, service_name] = []
+        l_days[patient_name, service_name].append(day_name)
+    for days in l_days.values():
+        days.sort()
+
+    # patient -> services that the patient could receive
+    patient_services = dict()
+    for patient_name, service_name in l_days.keys():
+        if patient_name not in patient_services:
+            patient_services[patient_name] = set()
+        patient_services[patient_name].add(service_name)
+
+    # a necessity starting after some days forbids the second service until then
+    interdiction = {service_name: dict(times) for service_name, times in full_input['interdiction'].items()}
+    for service_name1, necessities in full_input['necessity'].items():
+        for service_name2, times in necessities.items():
+            if times[0] - 1 > interdiction[service_name1][service_name2]:
+                interdiction[service_name1][service_name2] = times[0] - 1
+
+    # all days in [min_day, max_day] in which the patient could receive the service
+    def get_l_days(patient_name, service_name, min_day, max_day):
+        days = l_days.get((patient_name, service_name), [])
+        return days[bisect_left(days, min_day):bisect_right(days, max_day)]
+
+    # (patient, service1, service2, day) -> days of service2 constrained by service1 done on day
+    necessities = dict()
+    interdictions = dict()
+    for patient_name, service_names in patient_services.items():
+        for service_name1 in service_names:
+            for service_name2, times in full_input['necessity'][service_name1].items():
+                if service_name2 not in service_names:
+                    continue
+                for day_name in l_days[patient_name, service_name1]:
+                    necessities[patient_name, service_name1, service_name2, day_name] = get_l_days(patient_name, service_name2, day_name + times[0], day_name + times[1])
+            for service_name2, time in interdiction[service_name1].items():
+                if time <= 0 or service_name2 not in service_names:
+                    continue
+                for day_name in l_days[patient_name, service_name1]:
+                    day_names = get_l_days(patient_name, service_name2, day_name + 1, day_name + time)
+                    if len(day_names) > 0:
+                        interdictions[patient_name, service_name1, service_name2, day_name] = day_names
+
+    # indexes for the propagation: l -> x containing it, x -> windows containing it,
+    # l -> necessities that it can satisfy, with the number of days still possible for each necessity
+    l_to_x = dict()
+    for patient_name, packet_name, day_name in x_indexes:
+        for service_name in full_input['abstract_packet'][packet_name]:
+            if (patient_name, service_name, day_name) not in l_to_x:
+                l_to_x[patient_name, service_name, day_name] = []
+            l_to_x[patient_name, service_name, day_name].append((patient_name, packet_name, day_name))
+    x_to_windows = dict()
+    window_day_numbers = []
+    for window_index, window in enumerate(windows):
+        for day_name in window["days"]:
+            x_index = (window["patient"], window["packet"], day_name)
+            if x_index not in x_to_windows:
+                x_to_windows[x_index] = []
+            x_to_windows[x_index].append(window_index)
+        window_day_numbers.append(len(window["days"]))
+    l_to_necessities = dict()
+    necessity_day_numbers = dict()
+    for necessity_index, day_names in necessities.items():
+        patient_name, _, service_name2, _ = necessity_index
+        for day_name2 in day_names:
+            if (patient_name, service_name2, day_name2) not in l_to_necessities:
+                l_to_necessities[patient_name, service_name2, day_name2] = []
+            l_to_necessities[patient_name, service_name2, day_name2].append(necessity_index)
+        necessity_day_numbers[necessity_index] = len(day_names)
+
+    removed_l_indexes = set()
+    removed_x_indexes = set()
+    removed_window_indexes = set()
+    l_indexes_to_remove = [(patient_name, service_name1, day_name) for (patient_name, service_name1, _, day_name), day_names in necessities.items() if len(day_names) == 0]
+    while len(l_indexes_to_remove) > 0:
+        l_index = l_indexes_to_remove.pop()
+        if l_index in removed_l_indexes:
+            continue
+        removed_l_indexes.add(l_index)
+        for x_index in l_to_x.get(l_index, []):
+            if x_index in removed_x_indexes:
+                continue
+            removed_x_indexes.add(x_index)
+            for window_index in x_to_windows[x_index]:
+                window_day_numbers[window_index] -= 1
+                if window_day_numbers[window_index] == 0:
+                    removed_window_indexes.add(window_index)
+        for necessity_index in l_to_necessities.get(l_index, []):
+            necessity_day_numbers[necessity_index] -= 1
+            if necessity_day_numbers[necessity_index] == 0:
+                patient_name, service_name1, _, day_name = necessity_index
+                l_indexes_to_remove.append((patient_name, service_name1, day_name))
+
+    presolved_windows = []
+    for window_index, window in enumerate(windows):
+        if window_index in removed_window_indexes:
+            continue
+        presolved_window = dict(window)
+        presolved_window["days"] = [day_name for day_name in window["days"] if (window["patient"], window["packet"], day_name) not in removed_x_indexes]
+        presolved_windows.append(presolved_window)
+
+    presolved_x_indexes = x_indexes - removed_x_indexes
+    presolved_l_indexes = l_indexes - removed_l_indexes
+    x_and_l_indexes = set()
+    for patient_name, packet_name, day_name in presolved_x_indexes:
+        for service_name in full_input['abstract_packet'][packet_name]:
+            x_and_l_indexes.add((patient_name, packet_name, service_name, day_name))
+
+    presolved_necessities = dict()
+    for necessity_index, day_names in necessities.items():
+        patient_name, service_name1, service_name2, day_name = necessity_index
+        if (patient_name, service_name1, day_name) in removed_l_indexes:
+            continue
+        presolved_necessities[necessity_index] = [day_name2 for day_name2 in day_names if (patient_name, service_name2, day_name2) not in removed_l_indexes]
+    presolved_interdictions = dict()
+    for interdiction_index, day_names in interdictions.items():
+        patient_name, service_name1, service_name2, day_name = interdiction_index
+        if (patient_name, service_name1, day_name) in removed_l_indexes:
+            continue
+        day_names = [day_name2 for day_name2 in day_names if (patient_name, service_name2, day_name2) not in removed_l_indexes]
+        if len(day_names) > 0:
+            presolved_interdictions[interdiction_index] = day_names
+
+    # (day, care_unit) -> l indexes of the services done in that care unit and day
+    capacity_buckets = dict()
+    for patient_name, service_name, day_name in presolved_l_indexes:
+        care_unit_name = full_input['services'][service_name]['careUnit']
+        if (day_name, care_unit_name) not in capacity_buckets:
+            capacity_buckets[day_name, care_unit_name] = []
+        capacity_buckets[day_name, care_unit_name].append((patient_name, service_name, day_name))
+    capacity_indexes = set()
+    for patient_name, packet_name, day_name in x_indexes:
+        for care_unit_name in care_units_touched_by_packet[packet_name]:
+            capacity_indexes.add((day_name, care_unit_name))
+    presolved_capacity_indexes = set()
+    for day_name, care_unit_name in capacity_indexes:
+        total_duration = sum(full_input['services'][service_name]['duration'] for _, service_name, _ in capacity_buckets.get((day_name, care_unit_name), []))
+        if total_duration > full_input['capacity'][str(day_name)][care_unit_name]:
+            presolved_capacity_indexes.add((day_name, care_unit_name))
+
+    candidates = []
+    for window_index, window in enumerate(presolved_windows):
+        for day_name in window["days"]:
+            candidates.append((window["patient"], window["packet"], day_name, window_index))
+
+    return {
+        "windows": presolved_windows,
+        "candidates": candidates,
+        "xIndexes": sorted(presolved_x_indexes),
+        "lIndexes": sorted(presolved_l_indexes),
+        "xAndLIndexes": sorted(x_and_l_indexes),
+        "capacityIndexes": sorted(presolved_capacity_indexes),
+        "capacityBuckets": capacity_buckets,
+        "necessities": presolved_necessities,
+        "interdictions": presolved_interdictions,
+        "eliminated": {
+            "variables": len(removed_window_indexes) + len(removed_x_indexes) + len(removed_l_indexes),
+            "constraints": (len(removed_window_indexes) + sum(len(full_input['abstract_packet'][packet_name]) for _, packet_name, _ in removed_x_indexes) +
+                len(capacity_indexes) - len(presolved_capacity_indexes) + len(interdictions) - len(presolved_interdictions) +
+                sum(1 for day_names in necessities.values() if len(day_names) > 0) - len(presolved_necessities)),
+            "windows": len(removed_window_indexes),
+            "x": len(removed_x_indexes),
+            "l": len(removed_l_indexes)
+        }
+    }
+
+# fields of the candidate days holding lists of tuples, and dicts with tuple keys
+candidate_days_tuple_lists = ("candidates", "xIndexes", "lIndexes", "xAndLIndexes", "capacityIndexes")
+candidate_days_tuple_dicts = ("capacityBuckets", "necessities", "interdictions")
+
+# save the candidate days with the key of their input; tuples become lists and dicts with tuple keys lists of [key, value]
+def save_candidate_days(key, candidate_days, cache_path):
+    content = dict(candidate_days)
+    for field in candidate_days_tuple_dicts:
+        content[field] = [[list(index), value] for index, value in candidate_days[field].items()]
+    with open(cache_path, "w") as f:
+        json.dump({"key": key, "candidateDays": content}, f, separators=(",", ":"))
+
+# the saved candidate days if they were computed from an input with this key (None otherwise)
+def load_candidate_days(key, cache_path):
+    if not os.path.isfile(cache_path):
+        return None
+    with open(cache_path, "r") as f:
+        content = json.load(f)
+    if content["key"] != key:
+        return None
+    candidate_days = content["candidateDays"]
+    for field in candidate_days_tuple_lists:
+        candidate_days[field] = [tuple(index) for index in candidate_days[field]]
+    for field in candidate_days_tuple_dicts:
+        candidate_days[field] = {tuple(index): value for index, value in candidate_days[field]}
+    for index, l_indexes in candidate_days["capacityBuckets"].items():
+        candidate_days["capacityBuckets"][index] = [tuple(l_index) for l_index in l_indexes]
+    return candidate_days
+
+# candidate days of the input, read from the cache file if it was written for the same input
+# (otherwise they are computed and the file is overwritten)
+def get_candidate_days(full_input, cache_path):
+    key = get_input_key(full_input)
+    candidate_days = load_candidate_days(key, cache_path)
+    if candidate_days is None:
+        candidate_days = compute_candidate_days(full_input)
+        save_candidate_days(key, candidate_days, cache_path)
+    return candidate_days
@@ -0,0 +1,55 @@
+from datetime import datetime
+
+import clingo
+
+# convert an input value in a clingo term: integers become numbers, names become constants
+def to_symbol(term):
+    if isinstance(term, int):
+        return clingo.Number(term)
+    return clingo.Function(term)
+
+# convert a clingo term back in the input value
+def from_symbol(symbol):
+    if symbol.type == clingo.SymbolType.Number:
+        return symbol.number
+    return str(symbol)
+
+# ground and solve the program in-process, returning the shown atoms of the last (best) model found
+# as (predicate, [arguments]) tuples, or None if the program is unsatisfiable.
+# facts are (predicate, [arguments]) tuples and are passed directly to the grounder.
+# With a time limit (in seconds) the search is stopped there, keeping the best model found so far.
+# If a statistics dict is given, it is filled with the size of the ground program, the grounding and solving times
+# and whether the search was completed (the last model is then optimal)
+def solve_asp_program(program, facts, statistics=None, time_limit=None):
+    control = clingo.Control(["--warn=none"])
+    with control.backend() as backend:
+        for predicate, arguments in facts:
+            atom = backend.add_atom(clingo.Function(predicate, [to_symbol(argument) for argument in arguments]))
+            backend.add_rule([atom])
+    control.add("base", [], program)
+    start_time = datetime.now()
+    control.ground([("base", [])])
+    grounding_time = (datetime.now() - start_time).total_seconds()
+
+    last_model = []
+    def on_model(model):
+        last_model[:] = model.symbols(shown=True)
+    if time_limit is None:
+        result = control.solve(on_model=on_model)
+    else:
+        with control.solve(on_model=on_model, async_=True) as handle:
+            if not handle.wait(time_limit):
+                handle.cancel()
+            result = handle.get()
+
+    if statistics is not None:
+        lp_statistics = control.statistics["problem"]["lp"]
+        statistics["atoms"] = int(lp_statistics["atoms"])
+        statistics["rules"] = int(lp_statistics["rules"])
+        statistics["groundingTime"] = grounding_time
+        statistics["solvingTime"] = control.statistics["summary"]["times"]["solve"]
+        statistics["exhausted"] = result.exhausted
+
+    if not result.satisfiable:
+        return None
+    return [(symbol.name, [from_symbol(argument) for argument in symbol.arguments]) for symbol in last_model]
@@ -4,6 +4,21 @@ import json
 import argparse
 from datetime import datetime
 
+from instance_runner import get_folder_path, get_instance_paths, run_on_instances
+
+# union-find root of an element, halving the path on the way
+def find_root(parents, element):
+    while parents[element] != element:
+        parents[element] = parents[parents[element]]
+        element = parents[element]
+    return element
+
+def join_roots(parents, element1, element2):
+    root1 = find_root(parents, element1)
+    root2 = find_root(parents, element2)
+    if root1 != root2:
+        parents[root2] = root1
+
 def compute_cores(services, packets, operators, requests, results, subsumptions, restrict):
 
     # packet -> [care_units affected by it]
@@ -13,61 +28,64 @@ def compute_cores(services, packets, operators, requests, results, subsumptions,
         for service_name in packet:
             care_unit_name = services[service_name]["careUnit"]
             care_unit_set.add(care_unit_name)
-        packet_to_care_units[packet_name] = care_unit_set
+        packet_to_care_units[packet_name] = sorted(care_unit_set)
     del packet_name, packet, service_name, care_unit_set, care_unit_name
 
+    # care_unit -> more day -> set of its less days
+    less_day_sets = dict()
+    for care_unit_name, care_unit_subsumptions in subsumptions.items():
+        less_day_sets[care_unit_name] = {more_day_name: set(less_day_names) for more_day_name, less_day_names in care_unit_subsumptions.items()}
+
     cores = dict()
     core_index = 0
 
     for day_name, day_results in results.items():
-        for patient_name, packets_not_done in day_results["notScheduledPackets"].items():
+        not_scheduled_packets = day_results["notScheduledPackets"]
+
+        # care unit -> scheduled (patient, packet) affecting it; care units are connected if a scheduled packet affects both of them
+        care_unit_to_packets = dict()
+        parents = dict()
+        for patient_name, patient in requests[day_name].items():
+            for packet_name in patient["packets"]:
+                if patient_name in not_scheduled_packets and packet_name in not_scheduled_packets[patient_name]:
+                    continue
+                care_unit_names = packet_to_care_units[packet_name]
+                for care_unit_name in care_unit_names:
+                    if care_unit_name not in care_unit_to_packets:
+                        care_unit_to_packets[care_unit_name] = []
+                        parents[care_unit_name] = care_unit_name
+                    care_unit_to_packets[care_unit_name].append((patient_name, packet_name))
+                    join_roots(parents, care_unit_names[0], care_unit_name)
+
+        # component root -> its care units and its scheduled (patient, packet), each one listed once
+        component_care_units = dict()
+        component_packets = dict()
+        for care_unit_name in sorted(care_unit_to_packets.keys()):
+            root = find_root(parents, care_unit_name)
+            if root not in component_care_units:
+                component_care_units[root] = []
+                component_packets[root] = set()
+            component_care_units[root].append(care_unit_name)
+            component_packets[root].update(care_unit_to_packets[care_unit_name])
+
+        for not_done_patient_name, packets_not_done in not_scheduled_packets.items():
             for packet_not_done in packets_not_done: # for each packet not done in the subproblem results
-                nodes_to_do = [{ #start the search with it
-                    "patient": patient_name,
-                    "packet": packet_not_done
-                }]
-                nodes_done = []
-                care_units_to_do = []
-                care_units_done = []
-                while len(nodes_to_do) > 0:
-                    current_node = nodes_to_do.pop()
-                    nodes_done.append(current_node) # do a node visit
-                    for care_unit in packet_to_care_units[current_node["packet"]]:
-                        if care_unit not in care_units_done:
-                            care_units_to_do.append(care_unit) # visit all new care units touched by the new packet
-                    while len(care_units_to_do) > 0:
-                        current_care_unit = care_units_to_do.pop()
-                        care_units_done.append(current_care_unit) # adds to the already-visited care_units
-                        for patient_name_to_add, patient_to_add in requests[day_name].items():
-                            for packet_name_to_add in patient_to_add["packets"]:
-                                if current_care_unit not in packet_to_care_units[packet_name_to_add]:
-                                    continue
-                                if patient_name_to_add in day_results["notScheduledPackets"] and packet_name_to_add in day_results["notScheduledPackets"][patient_name_to_add]:
-                                    continue
-                                already_done = False
-                                for node in nodes_done:
-                                    if node["patient"] == patient_name_to_add and node["packet"] == packet_name_to_add:
-                                        already_done = True
-                                        break
-                                if already_done:
-                                    continue
-                                for node in nodes_to_do:
-                                    if node["patient"] == patient_name_to_add and node["packet"] == packet_name_to_add:
-                                        already_done = True
-                                        break
-                                if already_done:
-                                    continue
-                                nodes_to_do.append({ # if another done packet affect the care_unit, adds it to the todo list
-                                    "patient": patient_name_to_add,
-                                    "packet": packet_name_to_add
-                                })
-                care_units_done.sort()
+                # the core is the packet itself with the components of all the care units it affects
+                care_units_done = set()
+                nodes_done = {(not_done_patient_name, packet_not_done)}
+                for care_unit_name in packet_to_care_units[packet_not_done]:
+                    if care_unit_name not in parents: # no scheduled packet uses this care unit
+                        care_units_done.add(care_unit_name)
+                        continue
+                    root = find_root(parents, care_unit_name)
+                    care_units_done.update(component_care_units[root])
+                    nodes_done.update(component_packets[root])
+                care_units_done = sorted(care_units_done)
                 packet_groupings: dict[str, list[str]] = dict() # group the (patient, packet) list by patient
-                while len(nodes_done) > 0:
-                    node = nodes_done.pop()
-                    if node["patient"] not in packet_groupings:
-                        packet_groupings[node["patient"]] = []
-                    packet_groupings[node["patient"]].append(node["packet"])
+                for patient_name, packet_name in sorted(nodes_done):
+                    if patient_name not in packet_groupings:
+                        packet_groupings[patient_name] = []
+                    packet_groupings[patient_name].append(packet_name)
                 multipackets = dict() # explode each grouping revealing the services
                 for patient_name, packet_grouping in packet_groupings.items():
                     service_set = set()
@@ -89,16 +107,11 @@ def compute_cores(services, packets, operators, requests, results, subsumptions,
                         }
                 core_days = [day_name] # look for days that are lesser than the current one in each care_unit
                 if not restrict:
-                    for lesser_day_name in operators.keys():
-                        if lesser_day_name == day_name:
-                            continue
-                        is_lesser_day = True
-                        for care_unit_name in care_units_done:
-                            if day_name not in subsumptions[care_unit_name] or lesser_day_name not in subsumptions[care_unit_name][day_name]:
-                                is_lesser_day = False
-                                break
-                        if is_lesser_day:
-                            core_days.append(lesser_day_name)
+                    lesser_day_names = set(operators.keys())
+                    lesser_day_names.discard(day_name)
+                    for care_unit_name in care_units_done:
+                        lesser_day_names &= less_day_sets[care_unit_name].get(day_name, set())
+                    core_days.extend(lesser_day_names)
                     core_days.sort()
                 cores[f"core{core_index:02}"] = {
                     "days": core_days,
@@ -108,58 +121,94 @@ def compute_cores(services, packets, operators, requests, results, subsumptions,
                 core_index += 1
     return cores
 
+# canonical form of a core: its days and its multipackets, each with its times and the patients that actually received it
+# (the default cuts of the master are one per actual patient, so cores with different patients are different)
+def get_core_signature(core):
+    return (tuple(sorted(core["days"])), tuple(sorted((multipacket_name, multipacket["times"], tuple(sorted(multipacket["actual"].keys())))
+        for multipacket_name, multipacket in core["multipackets"].items())))
+
+# remove duplicate cores and, with remove_dominated, dominated ones: a core whose multipackets include (as a multiset) the ones
+# of another core, on a subset of its days, only gives a weaker cut. Dominance ignores the actual patients, so it only holds for the
+# cuts of --expand-cores and --aggregate-cores. Returns the kept cores and the number of duplicate and dominated ones
+def filter_cores(cores, remove_dominated=False):
+    signatures = dict() # signature -> core name, first core only
+    for core_name, core in cores.items():
+        signature = get_core_signature(core)
+        if signature not in signatures:
+            signatures[signature] = core_name
+    duplicate_core_number = len(cores) - len(signatures)
+    if not remove_dominated:
+        return {core_name: core for core_name, core in cores.items() if core_name in signatures.values()}, duplicate_core_number, 0
+    # smaller multisets first, and more days first among equal ones, so that a core can only be dominated by an already kept one
+    def get_sort_key(signature):
+        return (sum(times for _, times, _ in signature[1]), -len(signature[0]), signature)
+    kept_signatures = []
+    day_to_kept_indexes = dict() # day -> indexes of the kept cores on that day
+    for signature in sorted(signatures.keys(), key=get_sort_key):
+        days, multipackets = signature
+        multipacket_times = dict()
+        for multipacket_name, times, _ in multipackets:
+            multipacket_times[multipacket_name] = times
+        is_dominated = False
+        for kept_index in day_to_kept_indexes.get(days[0], []) if len(days) > 0 else range(len(kept_signatures)):
+            kept_days, kept_multipackets = kept_signatures[kept_index]
+            if not set(days).issubset(kept_days):
+                continue
+            if all(multipacket_times.get(multipacket_name, 0) >= times for multipacket_name, times, _ in kept_multipackets):
+                is_dominated = True
+                break
+        if is_dominated:
+            continue
+        for day_name in days:
+            if day_name not in day_to_kept_indexes:
+                day_to_kept_indexes[day_name] = []
+            day_to_kept_indexes[day_name].append(len(kept_signatures))
+        kept_signatures.append(signature)
+    kept_core_names = set(signatures[signature] for signature in kept_signatures)
+    kept_cores = {core_name: core for core_name, core in cores.items() if core_name in kept_core_names}
+    return kept_cores, duplicate_core_number, len(signatures) - len(kept_signatures)
+
+def process_instance(instance_path, args):
+    with open(os.path.join(instance_path, "services.json"), "r") as f:
+        services = json.load(f)
+    with open(os.path.join(instance_path, "packets.json"), "r") as f:
+        packets = json.load(f)
+    with open(os.path.join(instance_path, "operators.json"), "r") as f:
+        operators = json.load(f)
+    with open(os.path.join(instance_path, "requests.json"), "r") as f:
+        requests = json.load(f)
+    with open(os.path.join(instance_path, "results.json"), "r") as f:
+        results = json.load(f)
+    with open(os.path.join(instance_path, "subsumptions.json"), "r") as f:
+        subsumptions = json.load(f)
+    start_time = datetime.now()
+    cores = compute_cores(services, packets, operators, requests, results, subsumptions, args.restrict)
+    cores, duplicate_core_number, dominated_core_number = filter_cores(cores, args.remove_dominated)
+    end_time = datetime.now()
+    with open(os.path.join(instance_path, "cores.json"), "w") as f:
+        json.dump(cores, f, indent=4)
+    if args.verbose and args.jobs <= 1:
+        print(f"(removed cores: {duplicate_core_number} duplicate, {dominated_core_number} dominated)", end=" ")
+    return (end_time - start_time).total_seconds()
+
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description="Compute the instances cores")
     parser.add_argument("-r", "--restrict", action="store_true", help="suppress core expansion to any less day")
+    parser.add_argument("--remove-dominated", action="store_true", help="also remove the dominated cores (only for a master with --expand-cores or --aggregate-cores)")
     parser.add_argument("-i", "--input", metavar="IN", type=str, default="instances", help="input folder with the instances")
+    parser.add_argument("-j", "--jobs", metavar="NUM", type=int, default=1, help="number of instances processed in parallel")
     parser.add_argument("-v", "--verbose", action="store_true", help="show what is done")
     args = parser.parse_args(sys.argv[1:])
 
-    os.chdir(os.path.dirname(os.path.abspath(sys.argv[0])))
-
-    if not os.path.isdir(args.input):
-        raise FileNotFoundError(f"Input folder '{args.input}' not found")
-    os.chdir(args.input)
+    instance_paths = get_instance_paths(get_folder_path(sys.argv[0], args.input))
 
-    instance_number = len(os.listdir("."))
+    instance_number = len(instance_paths)
     if instance_number == 0:
         print("No instance folder found. No action taken.")
         exit(0)
 
-    if args.verbose:
-        total_time = 0
-
-    for folder_name in os.listdir("."):
-        os.chdir(folder_name)
-        if args.verbose:
-            print(f"Read instance '{folder_name}' ... ", end=" ")
-        with open("services.json", "r") as f:
-            services = json.load(f)
-        with open("packets.json", "r") as f:
-            packets = json.load(f)
-        with open("operators.json", "r") as f:
-            operators = json.load(f)
-        with open("priorities.json", "r") as f:
-            priorities = json.load(f)
-        with open("requests.json", "r") as f:
-            requests = json.load(f)
-        with open("results.json", "r") as f:
-            results = json.load(f)
-        with open("subsumptions.json", "r") as f:
-            subsumptions = json.load(f)
-        if args.verbose:
-            start_time = datetime.now()
-        cores = compute_cores(services, packets, operators, requests, results, subsumptions, args.restrict)
-        if args.verbose:
-            end_time = datetime.now()
-        with open("cores.json", "w") as f:
-            json.dump(cores, f, indent=4)
-        if args.verbose:
-            delta = (end_time - start_time).total_seconds()
-            print(f"finished! Time taken: {delta}s")
-            total_time += delta
-        os.chdir("..")
+    total_time = run_on_instances(process_instance, instance_paths, args)
 
     if args.verbose:
-        print(f"Solved subproblem for {instance_number} instance(s). Total time taken: {total_time}s, average: {total_time / instance_number}s")
\ No newline at end of file
+        print(f"Computed cores for {instance_number} instance(s). Total time taken: {total_time}s, average: {total_time / instance_number}s")
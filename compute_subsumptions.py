@@ -2,13 +2,18 @@ import os
 import sys
 import json
 import argparse
-import subprocess
 from datetime import datetime
 
-from pyomo.environ import ConcreteModel, SolverFactory, maximize, TerminationCondition
+import numpy as np
+
+from pyomo.environ import ConcreteModel, maximize
 from pyomo.environ import Set, Var, Objective, Constraint
 from pyomo.environ import Boolean
 
+from clingo_backend import solve_asp_program
+from solvers import solver_backends, get_solver_settings, solve_model
+from instance_runner import get_folder_path, get_instance_paths, run_on_instances
+
 asp_program = """
 % choose variables for each Less operator contained in More
 { choose(Less, More) } :-
@@ -40,24 +45,15 @@ def get_care_unit_names(operators):
 
 # true if it exists a match
 def is_asp_program_satisfiable(more_operators, less_operators):
-    more_program = ""
-    for more_operator_name, more_operator in more_operators.items(): # write the input program
-        more_program += f"more({more_operator_name}, {more_operator['start']}, {more_operator['duration']}).\n"
-    less_program = ""
-    for less_operator_name, less_operator in less_operators.items(): # write the input program
-        less_program += f"less({less_operator_name}, {less_operator['start']}, {less_operator['duration']}).\n"
-    with open("input.lp", "w") as f:
-        f.write(more_program + less_program)
-    with open("program.lp", "w") as f:
-        f.write(asp_program)
-    with open("output.txt", "w") as f:
-        subprocess.run(["clingo", "input.lp", "program.lp"], stdout=f, stderr=subprocess.DEVNULL)
-    with open("output.txt", "r") as f:
-        if "UNSATISFIABLE" not in f.read():
-            return True
-    return False
+    facts = []
+    for more_operator_name, more_operator in more_operators.items(): # write the input facts
+        facts.append(("more", [more_operator_name, more_operator['start'], more_operator['duration']]))
+    for less_operator_name, less_operator in less_operators.items(): # write the input facts
+        facts.append(("less", [less_operator_name, less_operator['start'], less_operator['duration']]))
+    return solve_asp_program(asp_program, facts) is not None
 
-def is_milp_program_satisfiable(more_operators, less_operators):
+# a match found by the solver proves the subsumption; a solve stopped by a limit without one is taken as no subsumption
+def is_milp_program_satisfiable(more_operators, less_operators, solver=None):
     x_indexes = []
     for more_operator_name, more_operator in more_operators.items():
         for less_operator_name, less_operator in less_operators.items():
@@ -90,124 +86,200 @@ def is_milp_program_satisfiable(more_operators, less_operators):
     def f2(model, less_operator_index1, less_operator_index2, more_operator_index):
         return model.x[less_operator_index1, more_operator_index] + model.x[less_operator_index2, more_operator_index] <= 1
     model.not_overlap = Constraint(model.not_overlap_indexes, rule=f2)
-    opt = SolverFactory("gurobi")
-    results = opt.solve(model)
-    if results.solver.termination_condition == TerminationCondition.infeasible:
+    outcome = solve_model(model, solver if solver is not None else get_solver_settings())
+    return outcome["hasSolution"]
+
+def is_solver_match_possible(more_operators, less_operators, method, solver=None):
+    if method == "asp":
+        return is_asp_program_satisfiable(more_operators, less_operators)
+    return is_milp_program_satisfiable(more_operators, less_operators, solver)
+
+# true if at least two operators overlap in time (sweep line over the start-sorted intervals)
+def there_is_overlap(operators):
+    max_end = None
+    for start, end in sorted((operator["start"], operator["start"] + operator["duration"]) for operator in operators):
+        if max_end is not None and start < max_end:
+            return True
+        if max_end is None or end > max_end:
+            max_end = end
+    return False
+
+# Kuhn's augmenting paths: true if every less operator can be given a distinct more operator among its candidates
+def is_perfect_matching_possible(candidates):
+    matched_less = dict() # more operator index -> less operator index
+    def augment(less_index, visited):
+        for more_index in candidates[less_index]:
+            if more_index in visited:
+                continue
+            visited.add(more_index)
+            if more_index not in matched_less or augment(matched_less[more_index], visited):
+                matched_less[more_index] = less_index
+                return True
         return False
+    for less_index in range(len(candidates)):
+        if not augment(less_index, set()):
+            return False
     return True
 
-def compute_subsumptions(operators, method):
+# decide the match without solvers: True or False if the fast path can tell, None otherwise
+def is_native_match_possible(more_operators, less_operators):
+    more_intervals = sorted((operator["start"], operator["start"] + operator["duration"]) for operator in more_operators.values())
+    less_intervals = sorted((operator["start"], operator["start"] + operator["duration"]) for operator in less_operators.values())
+    candidates = []
+    for less_start, less_end in less_intervals: # more operators that contain each less one
+        candidates.append([index for index, (more_start, more_end) in enumerate(more_intervals) if more_start <= less_start and more_end >= less_end])
+        if len(candidates[-1]) == 0:
+            return False
+    if not there_is_overlap(less_operators.values()): # every less operator can share its more operator
+        return True
+    # greedy by start time: each less operator goes to the containing free more operator that ends first
+    busy_until = [None] * len(more_intervals)
+    is_greedy_successful = True
+    for (less_start, less_end), less_candidates in zip(less_intervals, candidates):
+        free_candidates = [index for index in less_candidates if busy_until[index] is None or busy_until[index] <= less_start]
+        if len(free_candidates) == 0:
+            is_greedy_successful = False
+            break
+        chosen_index = min(free_candidates, key=lambda index: (more_intervals[index][1], index))
+        busy_until[chosen_index] = less_end
+    if is_greedy_successful:
+        return True
+    # the less operators active at each start time are pairwise overlapping and need distinct more operators
+    for less_start, _ in less_intervals:
+        active_candidates = [less_candidates for (start, end), less_candidates in zip(less_intervals, candidates) if start <= less_start and end > less_start]
+        if not is_perfect_matching_possible(active_candidates):
+            return False
+    return None
+
+# canonical form of the operators of a day in a care unit: days with the same signature are interchangeable
+def get_operator_signature(care_unit_operators):
+    return tuple(sorted((operator["start"], operator["duration"]) for operator in care_unit_operators.values()))
+
+# reflexive-free transitive closure of a relation given as element -> set of related elements
+def get_transitive_closure(relation):
+    closure = dict()
+    for element in relation.keys():
+        reached = set()
+        elements_to_do = list(relation[element])
+        while len(elements_to_do) > 0:
+            other_element = elements_to_do.pop()
+            if other_element in reached:
+                continue
+            reached.add(other_element)
+            elements_to_do.extend(relation[other_element])
+        reached.discard(element)
+        closure[element] = reached
+    return closure
+
+# necessary conditions for the match of every (more, less) pair of signatures, as a boolean matrix:
+# the less total duration must not exceed the more one and each less operator must be contained in some more operator
+def get_feasibility_matrix(signatures):
+    total_durations = np.array([sum(duration for _, duration in signature) for signature in signatures], dtype=np.int64)
+    is_feasible = total_durations[:, np.newaxis] >= total_durations[np.newaxis, :]
+    class_sizes = np.array([len(signature) for signature in signatures], dtype=np.int64)
+    operator_number = int(class_sizes.sum())
+    if operator_number == 0:
+        return is_feasible
+    # all operators of all signatures, packed class after class
+    starts = np.array([start for signature in signatures for start, _ in signature], dtype=np.int64)
+    ends = starts + np.array([duration for signature in signatures for _, duration in signature], dtype=np.int64)
+    class_offsets = np.concatenate(([0], np.cumsum(class_sizes)[:-1]))
+    is_nonempty = class_sizes > 0
+    nonempty_offsets = class_offsets[is_nonempty]
+    # is_contained[less operator, more operator]
+    is_contained = (starts[np.newaxis, :] <= starts[:, np.newaxis]) & (ends[np.newaxis, :] >= ends[:, np.newaxis])
+    # fits[less operator, more class]: some operator of the more class contains the less one (empty classes contain nothing)
+    fits = np.zeros((operator_number, len(signatures)), dtype=bool)
+    fits[:, is_nonempty] = np.logical_or.reduceat(is_contained, nonempty_offsets, axis=1)
+    # all_fit[more class, less class]: every operator of the less class fits (empty classes always do)
+    all_fit = np.ones((len(signatures), len(signatures)), dtype=bool)
+    all_fit[:, is_nonempty] = np.logical_and.reduceat(fits, nonempty_offsets, axis=0).T
+    return is_feasible & all_fit
+
+# the milp method uses the solver settings of get_solver_settings (gurobi with its defaults if None)
+def compute_subsumptions(operators, method, cross_check=False, solver=None):
     subsumptions = dict()
     for care_unit_name in get_care_unit_names(operators): # for each care unit
-        care_unit_subsumptions = dict()
-        for more_day_name, more_day in operators.items(): # for each more day
-            if len(more_day) == 0:
+        class_day_names = dict() # signature -> days with those operators
+        class_operators = dict() # signature -> operators of one of those days
+        for day_name, day in operators.items():
+            if len(day) == 0:
                 continue
-            less_day_names = set()
-            more_total_duration = 0
-            for more_operator in more_day[care_unit_name].values(): # write the input program
-                more_total_duration += more_operator["duration"] # sum the operators" duration
-            for less_day_name, less_day in operators.items(): # for each less day
-                if more_day_name == less_day_name: # symmetric check
-                    continue
-                if len(less_day) == 0:
-                    continue
-                if less_day_name in less_day_names: # if already in the less list
-                    continue
-                less_total_duration = 0
-                all_less_operators_are_satisfiable = True
-                for less_operator in less_day[care_unit_name].values(): # write che input program
-                    less_total_duration += less_operator["duration"] # sum the operators" duration
-                    is_operator_satisfiable = False
-                    for more_operator in more_day[care_unit_name].values(): # search at least one more operator that contains the less one
-                        if more_operator["start"] <= less_operator["start"] and more_operator["start"] + more_operator["duration"] >= less_operator["start"] + less_operator["duration"]:
-                            is_operator_satisfiable = True
-                            break
-                    if not is_operator_satisfiable:
-                        all_less_operators_are_satisfiable = False
-                        break
-                if less_total_duration > more_total_duration: # check for impossibility regarding the total durations
+            signature = get_operator_signature(day[care_unit_name])
+            if signature not in class_day_names:
+                class_day_names[signature] = []
+                class_operators[signature] = day[care_unit_name]
+            class_day_names[signature].append(day_name)
+        total_durations = {signature: sum(duration for _, duration in signature) for signature in class_day_names.keys()}
+        signatures = sorted(class_day_names.keys(), key=lambda signature: (total_durations[signature], signature))
+        class_subsumptions = {signature: set() for signature in signatures}
+        is_feasible = get_feasibility_matrix(signatures)
+        for more_index, more_signature in enumerate(signatures): # smaller classes first, so that their relation can be reused by transitivity
+            more_operators = class_operators[more_signature]
+            for less_index in np.flatnonzero(is_feasible[more_index])[::-1]: # only the classes passing the necessary conditions, bigger first
+                less_signature = signatures[less_index]
+                if less_signature == more_signature or less_signature in class_subsumptions[more_signature]:
                     continue
-                if not all_less_operators_are_satisfiable: # check for impossibility regarding operators satisfiability
-                    continue
-                if len(less_day[care_unit_name]) == 1:
-                    less_day_names.add(less_day_name) # add the subsumption if a match exists
-                    if less_day_name in care_unit_subsumptions: # relation transitivity check
-                        less_day_names.update(care_unit_subsumptions[less_day_name])
-                less_operator_list = list(less_day[care_unit_name].values())
-                there_is_overlap = False
-                for index1 in range(len(less_operator_list) - 1):
-                    for index2 in range(index1 + 1, len(less_operator_list)):
-                        if less_operator_list[index1]["start"] <= less_operator_list[index2]["start"] and less_operator_list[index1]["start"] + less_operator_list[index1]["duration"] > less_operator_list[index2]["start"] + less_operator_list[index2]["duration"]:
-                            there_is_overlap = True
-                            break
-                        if less_operator_list[index2]["start"] <= less_operator_list[index1]["start"] and less_operator_list[index2]["start"] + less_operator_list[index2]["duration"] > less_operator_list[index1]["start"] + less_operator_list[index1]["duration"]:
-                            there_is_overlap = True
-                            break
-                    if there_is_overlap:
-                        break
-                if method == "asp":
-                    if not there_is_overlap or is_asp_program_satisfiable(more_day[care_unit_name], less_day[care_unit_name]):
-                        less_day_names.add(less_day_name) # add the subsumption if a match exists
-                        if less_day_name in care_unit_subsumptions: # relation transitivity check
-                            less_day_names.update(care_unit_subsumptions[less_day_name])
-                elif method == "milp":
-                    if not there_is_overlap or is_milp_program_satisfiable(more_day[care_unit_name], less_day[care_unit_name]):
-                        less_day_names.add(less_day_name) # add the subsumption if a match exists
-                        if less_day_name in care_unit_subsumptions: # relation transitivity check
-                            less_day_names.update(care_unit_subsumptions[less_day_name])
+                less_operators = class_operators[less_signature]
+                is_match_possible = is_native_match_possible(more_operators, less_operators)
+                if cross_check and is_match_possible is not None: # compare the fast path with the solvers
+                    solver_result = is_solver_match_possible(more_operators, less_operators, method, solver)
+                    if solver_result != is_match_possible:
+                        print(f"Mismatch on care unit '{care_unit_name}', days '{class_day_names[more_signature][0]}' > '{class_day_names[less_signature][0]}': native {is_match_possible}, {method} {solver_result}")
+                        is_match_possible = solver_result
+                if is_match_possible is None: # undecided by the fast path, fall back to the solvers
+                    is_match_possible = is_solver_match_possible(more_operators, less_operators, method, solver)
+                if is_match_possible:
+                    class_subsumptions[more_signature].add(less_signature) # add the subsumption if a match exists
+                    class_subsumptions[more_signature].update(class_subsumptions[less_signature]) # relation transitivity
+        # classes with the same total duration are visited in any order, so the closure is completed here
+        class_subsumptions = get_transitive_closure(class_subsumptions)
+        care_unit_subsumptions = dict()
+        for day_name, day in operators.items(): # expand the classes back to days
+            if len(day) == 0:
+                continue
+            signature = get_operator_signature(day[care_unit_name])
+            less_day_names = set(class_day_names[signature]) # days with the same operators subsume each other
+            for less_signature in class_subsumptions[signature]:
+                less_day_names.update(class_day_names[less_signature])
+            less_day_names.discard(day_name)
             if len(less_day_names) > 0:
-                care_unit_subsumptions[more_day_name] = sorted(less_day_names)
+                care_unit_subsumptions[day_name] = sorted(less_day_names)
         subsumptions[care_unit_name] = care_unit_subsumptions
-    # removing of temporary working files
-    if os.path.isfile("input.lp"):
-        os.remove("input.lp")
-    if os.path.isfile("program.lp"):
-        os.remove("program.lp")
-    if os.path.isfile("output.txt"):
-        os.remove("output.txt")
     return subsumptions
 
+def process_instance(instance_path, args):
+    with open(os.path.join(instance_path, "operators.json"), "r") as f:
+        operators = json.load(f)
+    start_time = datetime.now()
+    solver = get_solver_settings(args.solver, args.solver_time_limit, threads=args.threads)
+    subsumptions = compute_subsumptions(operators, args.method, args.cross_check, solver)
+    end_time = datetime.now()
+    with open(os.path.join(instance_path, "subsumptions.json"), "w") as f:
+        json.dump(subsumptions, f, indent=4)
+    return (end_time - start_time).total_seconds()
+
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description="Compute thesubsumption relation for each instance")
     parser.add_argument("-m", "--method", metavar="MET", type=str, default="asp", choices=["asp", "milp"], help="solution method used (asp|milp)")
     parser.add_argument("-i", "--input", metavar="IN", type=str, default="instances", help="input folder with the instances")
+    parser.add_argument("-s", "--solver", metavar="SOL", type=str, default="gurobi", choices=list(solver_backends.keys()), help="solver used by the milp method (gurobi|highs|cbc)")
+    parser.add_argument("--solver-time-limit", metavar="SEC", type=float, default=None, help="stop the MILP solve of each pair of days after these many seconds (no match found means no subsumption)")
+    parser.add_argument("--threads", metavar="NUM", type=int, default=None, help="threads used by the MILP solver")
+    parser.add_argument("--cross-check", action="store_true", help="also run the solver on the pairs decided without it and report any mismatch")
+    parser.add_argument("-j", "--jobs", metavar="NUM", type=int, default=1, help="number of instances processed in parallel")
     parser.add_argument("-v", "--verbose", action="store_true", help="show what is done")
     args = parser.parse_args(sys.argv[1:])
 
-    os.chdir(os.path.dirname(os.path.abspath(sys.argv[0])))
-
-    if not os.path.isdir(args.input):
-        raise FileNotFoundError(f"Input folder '{args.input}' not found")
-    os.chdir(args.input)
+    instance_paths = get_instance_paths(get_folder_path(sys.argv[0], args.input))
 
-    instance_number = len(os.listdir("."))
+    instance_number = len(instance_paths)
     if instance_number == 0:
         print("No instance folder found. No action taken.")
         exit(0)
 
-    if args.verbose:
-        total_time = 0
-
-    for folder_name in os.listdir("."):
-        os.chdir(folder_name)
-        if args.verbose:
-            print(f"Read instance '{folder_name}' ... ", end=" ")
-        with open("operators.json", "r") as f:
-            operators = json.load(f)
-        if args.verbose:
-            start_time = datetime.now()
-        subsumptions = compute_subsumptions(operators, args.method)
-        if args.verbose:
-            end_time = datetime.now()
-        with open("subsumptions.json", "w") as f:
-            json.dump(subsumptions, f, indent=4)
-        if args.verbose:
-            delta = (end_time - start_time).total_seconds()
-            print(f"finished! Time taken: {delta}s")
-            total_time += delta
-        os.chdir("..")
+    total_time = run_on_instances(process_instance, instance_paths, args)
 
     if args.verbose:
-        print(f"Computed subsumptions for {instance_number} instance(s). Total time taken: {total_time}s, average: {total_time / instance_number}s")
\ No newline at end of file
+        print(f"Computed subsumptions for {instance_number} instance(s). Total time taken: {total_time}s, average: {total_time / instance_number}s")
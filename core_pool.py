@@ -0,0 +1,145 @@
+import os
+import json
+
+from pyomo.environ import value
+
+# The core pool keeps the master cuts across solves. A cut is a (kind, data) tuple:
+# ("list", [[patient, service, day], ...]) or ("aggregated", [day, [[services, patients], ...]]).
+# Each cut is stored once, with the number of solves in which it was binding and how many solves passed since it last was.
+
+def create_core_pool():
+    return {
+        "cuts": dict() # key -> {"cut", "binding", "idle"}
+    }
+
+# canonical form of a cut, equal for cuts with the same meaning
+def get_cut_key(cut):
+    kind, data = cut
+    if kind == "list":
+        return (kind, tuple(sorted((patient_name, service_name, int(day_name)) for patient_name, service_name, day_name in data)))
+    day_name, multipackets = data
+    return (kind, int(day_name), tuple(sorted((tuple(services), tuple(sorted(patients))) for services, patients in multipackets)))
+
+# add a cut to the pool, returning its key, or None if the same cut is already there
+def add_pool_cut(pool, cut, binding=0, idle=0):
+    key = get_cut_key(cut)
+    if key in pool["cuts"]:
+        return None
+    pool["cuts"][key] = {
+        "cut": cut,
+        "binding": binding,
+        "idle": idle
+    }
+    return key
+
+# Kuhn's augmenting paths on the lists of candidates of each element
+def get_max_matching_size(candidates):
+    matched = dict()
+    def augment(index, visited):
+        for candidate in candidates[index]:
+            if candidate in visited:
+                continue
+            visited.add(candidate)
+            if candidate not in matched or augment(matched[candidate], visited):
+                matched[candidate] = index
+                return True
+        return False
+    return sum(1 for index in range(len(candidates)) if augment(index, set()))
+
+def is_service_done(model, patient_name, service_name, day_name):
+    index = (patient_name, service_name, int(day_name))
+    return index in model.l and (value(model.l[index], exception=False) or 0) > 0.5
+
+# a cut is binding if the master solution in the model is at the limit it imposes
+def is_cut_binding(model, cut):
+    kind, data = cut
+    if kind == "list":
+        return sum(1 for patient_name, service_name, day_name in data if is_service_done(model, patient_name, service_name, day_name)) == len(data) - 1
+    day_name, multipackets = data
+    candidates = [] # patients receiving all the services of each multipacket
+    for services, patients in multipackets:
+        candidates.append([patient_name for patient_name in patients
+            if all(is_service_done(model, patient_name, service_name, day_name) for service_name in services)])
+    return get_max_matching_size(candidates) == len(multipackets) - 1
+
+# update the binding statistics with the solution loaded in the model; returns the number of binding cuts
+def update_core_pool(pool, model):
+    binding_cut_number = 0
+    for entry in pool["cuts"].values():
+        if is_cut_binding(model, entry["cut"]):
+            entry["binding"] += 1
+            entry["idle"] = 0
+            binding_cut_number += 1
+        else:
+            entry["idle"] += 1
+    return binding_cut_number
+
+# when the pool holds more than max_size cuts, remove the ones not binding for at least max_idle solves
+# (the longest idle first) until the size is respected. The cuts binding in the last solve are always kept,
+# or the next solve could return the same rejected assignment. Returns the keys of the removed cuts
+def evict_pool_cuts(pool, max_idle, max_size=None):
+    evicted_keys = []
+    if max_size is None or len(pool["cuts"]) <= max_size:
+        return evicted_keys
+    idle_keys = [key for key, entry in pool["cuts"].items() if entry["idle"] >= max(1, max_idle)]
+    idle_keys.sort(key=lambda key: (-pool["cuts"][key]["idle"], pool["cuts"][key]["binding"], key))
+    for key in idle_keys:
+        if len(pool["cuts"]) <= max_size:
+            break
+        del pool["cuts"][key]
+        evicted_keys.append(key)
+    return evicted_keys
+
+# pool made of the cuts of an old 'prev_cores.json'
+def create_core_pool_from_prev_cores(prev_cores):
+    pool = create_core_pool()
+    for core_list in prev_cores["list"]:
+        add_pool_cut(pool, ("list", core_list))
+    for aggregated_cut in prev_cores.get("aggregated", []):
+        add_pool_cut(pool, ("aggregated", aggregated_cut))
+    return pool
+
+# on disk, patient and service names are replaced by their position in two shared tables;
+# each cut is [kind, binding, idle, data] with the list cuts as [patient, service, day] triples
+def save_core_pool(pool, pool_path):
+    patient_names = set()
+    service_names = set()
+    for entry in pool["cuts"].values():
+        kind, data = entry["cut"]
+        if kind == "list":
+            patient_names.update(patient_name for patient_name, _, _ in data)
+            service_names.update(service_name for _, service_name, _ in data)
+        else:
+            patient_names.update(patient_name for _, patients in data[1] for patient_name in patients)
+            service_names.update(service_name for services, _ in data[1] for service_name in services)
+    patient_names = sorted(patient_names)
+    service_names = sorted(service_names)
+    patient_ids = {patient_name: index for index, patient_name in enumerate(patient_names)}
+    service_ids = {service_name: index for index, service_name in enumerate(service_names)}
+    cuts = []
+    for key in sorted(pool["cuts"].keys()):
+        entry = pool["cuts"][key]
+        kind, data = entry["cut"]
+        if kind == "list":
+            compact_data = [[patient_ids[patient_name], service_ids[service_name], int(day_name)] for patient_name, service_name, day_name in data]
+        else:
+            compact_data = [int(data[0]), [[[service_ids[service_name] for service_name in services], [patient_ids[patient_name] for patient_name in patients]] for services, patients in data[1]]]
+        cuts.append([kind, entry["binding"], entry["idle"], compact_data])
+    with open(pool_path, "w") as f:
+        json.dump({"patients": patient_names, "services": service_names, "cuts": cuts}, f, separators=(",", ":"))
+
+def load_core_pool(pool_path):
+    pool = create_core_pool()
+    if not os.path.isfile(pool_path):
+        return pool
+    with open(pool_path, "r") as f:
+        compact_pool = json.load(f)
+    patient_names = compact_pool["patients"]
+    service_names = compact_pool["services"]
+    for kind, binding, idle, compact_data in compact_pool["cuts"]:
+        if kind == "list":
+            data = [[patient_names[patient_id], service_names[service_id], day_name] for patient_id, service_id, day_name in compact_data]
+        else:
+            data = [f"{compact_data[0]}", [[[service_names[service_id] for service_id in service_ids], [patient_names[patient_id] for patient_id in patient_ids]] for service_ids, patient_ids in compact_data[1]]]
+        add_pool_cut(pool, (kind, data), binding, idle)
+    return pool
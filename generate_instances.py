@@ -5,6 +5,8 @@ import random
 import argparse
 from datetime import datetime
 
+from instance_runner import get_folder_path, run_on_instances
+
 ################################################################################
 #                            GENERATOR CONFIGURATION                           #
 ################################################################################
@@ -225,6 +227,47 @@ def generate_full_input(operators, services, packets):
             }
             return full_input
 
+# generate one instance in its folder; the generator is seeded with the seed and the folder name,
+# so the output does not depend on how many instances are generated in parallel
+def process_instance(instance_path, args):
+    start_time = datetime.now()
+    random.seed(f"{args.seed}_{os.path.basename(instance_path)}")
+    if not os.path.isdir(instance_path):
+        os.mkdir(instance_path)
+
+    services = generate_services()
+    packets = generate_packets()
+    operators = generate_operators()
+    priorities = generate_priorities()
+    if args.only_requests:
+        requests = generate_requests()
+    else:
+        full_input = generate_full_input(operators, services, packets)
+
+    with open(os.path.join(instance_path, "services.json"), "w") as f:
+        json.dump(services, f, indent=4)
+    with open(os.path.join(instance_path, "packets.json"), "w") as f:
+        json.dump(packets, f, indent=4)
+    with open(os.path.join(instance_path, "operators.json"), "w") as f:
+        json.dump(operators, f, indent=4)
+    with open(os.path.join(instance_path, "priorities.json"), "w") as f:
+        json.dump(priorities, f, indent=4)
+    if args.only_requests:
+        with open(os.path.join(instance_path, "requests.json"), "w") as f:
+            json.dump(requests, f, indent=4)
+        if os.path.isfile(os.path.join(instance_path, "full_input.json")):
+            os.remove(os.path.join(instance_path, "full_input.json"))
+    else:
+        with open(os.path.join(instance_path, "full_input.json"), "w") as f:
+            json.dump(full_input, f, indent=4)
+        if os.path.isfile(os.path.join(instance_path, "requests.json")):
+            os.remove(os.path.join(instance_path, "requests.json"))
+    for file_name in ["subsumptions.json", "results.json", "cores.json", "prev_cores.json", "core_pool.json"]:
+        if os.path.isfile(os.path.join(instance_path, file_name)):
+            os.remove(os.path.join(instance_path, file_name))
+    end_time = datetime.now()
+    return (end_time - start_time).total_seconds()
+
 if __name__ == "__main__":
 
     def check_number(n: str):
@@ -238,62 +281,22 @@ if __name__ == "__main__":
     parser.add_argument("-p", "--prefix", metavar="PRE", type=str, default="instance", help="prefix for the generated folder(s)")
     parser.add_argument("-o", "--output", metavar="OUT", type=str, default="instances", help="destination folder for the output")
     parser.add_argument("--only-requests", action="store_true", help="don't generate the protocol input")
+    parser.add_argument("-j", "--jobs", metavar="NUM", type=int, default=1, help="number of instances generated in parallel")
     parser.add_argument("-v", "--verbose", action="store_true", help="show what is done")
     args = parser.parse_args(sys.argv[1:])
 
-    os.chdir(os.path.dirname(os.path.abspath(sys.argv[0])))
+    output_path = get_folder_path(sys.argv[0], args.output)
 
-    if not os.path.isdir(args.output):
-        os.mkdir(args.output)
+    if not os.path.isdir(output_path):
+        os.mkdir(output_path)
         if args.verbose:
             print(f"Created the '{args.output}' folder containing all instances")
-    os.chdir(args.output)
 
+    instance_paths = []
     for instance_index in range(int(args.number)):
-        if not os.path.isdir(f"{args.prefix}{instance_index:02}"):
-            os.mkdir(f"{args.prefix}{instance_index:02}")
-            if args.verbose:
-                print(f"Created the folder '{args.prefix}{instance_index:02}'", end=" ")
-        os.chdir(f"{args.prefix}{instance_index:02}")
-
-        services = generate_services()
-        packets = generate_packets()
-        operators = generate_operators()
-        priorities = generate_priorities()
-        if args.only_requests:
-            requests = generate_requests()
-        else:
-            full_input = generate_full_input(operators, services, packets)
-
-        with open("services.json", "w") as f:
-            json.dump(services, f, indent=4)
-        with open("packets.json", "w") as f:
-            json.dump(packets, f, indent=4)
-        with open("operators.json", "w") as f:
-            json.dump(operators, f, indent=4)
-        with open("priorities.json", "w") as f:
-            json.dump(priorities, f, indent=4)
-        if args.only_requests:
-            with open("requests.json", "w") as f:
-                json.dump(requests, f, indent=4)
-            if os.path.isfile("full_input.json"):
-                os.remove("full_input.json")
-        else:
-            with open("full_input.json", "w") as f:
-                json.dump(full_input, f, indent=4)
-            if os.path.isfile("requests.json"):
-                os.remove("requests.json")
-        if os.path.isfile("subsumptions.json"):
-            os.remove("subsumptions.json")
-        if os.path.isfile("results.json"):
-            os.remove("results.json")
-        if os.path.isfile("cores.json"):
-            os.remove("cores.json")
-        if os.path.isfile("prev_cores.json"):
-            os.remove("prev_cores.json")
-        if args.verbose:
-            print(f"Created instance '{args.prefix}{instance_index:02}'")
-        os.chdir("..")
+        instance_paths.append(os.path.join(output_path, f"{args.prefix}{instance_index:02}"))
+
+    run_on_instances(process_instance, instance_paths, args, "Generate instance")
 
     if args.verbose:
-        print(f"Generated {args.number} instance(s)")
\ No newline at end of file
+        print(f"Generated {args.number} instance(s)")
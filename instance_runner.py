@@ -0,0 +1,41 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# absolute path of a folder given relative to the scripts directory
+def get_folder_path(script_path, folder_name):
+    return os.path.join(os.path.dirname(os.path.abspath(script_path)), folder_name)
+
+# sorted absolute paths of all instance folders inside the input folder
+def get_instance_paths(input_path):
+    if not os.path.isdir(input_path):
+        raise FileNotFoundError(f"Input folder '{input_path}' not found")
+    instance_paths = []
+    for folder_name in sorted(os.listdir(input_path)):
+        if os.path.isdir(os.path.join(input_path, folder_name)):
+            instance_paths.append(os.path.join(input_path, folder_name))
+    return instance_paths
+
+# call 'process_instance(instance_path, args)' on each instance, using 'args.jobs' worker processes.
+# process_instance must be a module-level function that returns the time taken (in seconds) by the instance;
+# the total time is returned. Reports are printed in instance order, regardless of the completion order.
+def run_on_instances(process_instance, instance_paths, args, label="Read instance"):
+    total_time = 0
+
+    if args.jobs <= 1:
+        for instance_path in instance_paths:
+            if args.verbose:
+                print(f"{label} '{os.path.basename(instance_path)}' ... ", end=" ")
+            delta = process_instance(instance_path, args)
+            if args.verbose:
+                print(f"finished! Time taken: {delta}s")
+            total_time += delta
+        return total_time
+
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [executor.submit(process_instance, instance_path, args) for instance_path in instance_paths]
+        for instance_path, future in zip(instance_paths, futures):
+            delta = future.result()
+            if args.verbose:
+                print(f"{label} '{os.path.basename(instance_path)}' ...  finished! Time taken: {delta}s")
+            total_time += delta
+    return total_time
@@ -2,15 +2,20 @@ import os
 import sys
 import json
 import argparse
-import subprocess
 from datetime import datetime
 
-from pyomo.environ import ConcreteModel, SolverFactory, maximize, TerminationCondition
+from pyomo.environ import ConcreteModel, maximize
 from pyomo.environ import Set, Var, Objective, Constraint, ConstraintList
-from pyomo.environ import Boolean, value
+from pyomo.environ import Boolean, Any, value
+
+from clingo_backend import solve_asp_program
+from candidate_days import compute_candidate_days, get_candidate_days
+from solvers import solver_backends, get_solver_settings, create_solver, solve_model, solve_persistent_model, get_outcome_report
+from core_pool import create_core_pool, create_core_pool_from_prev_cores, load_core_pool, save_core_pool, add_pool_cut, update_core_pool, evict_pool_cuts
+from instance_runner import get_folder_path, get_instance_paths, run_on_instances
 
 asp_program = """
-% patient_requests_protocol(Patient, Protocol, Iteration, Packet, StartDay, ExistenceStart, ExistenceEnd, Frequency, Tolerance).
+% candidate(Patient, Packet, Day, Window).
 % patient_has_priority(Patient, Priority).
 % service(Service, CareUnit, Duration).
 % packet_has_service(Packet, Service).
@@ -19,17 +24,7 @@ asp_program = """
 % service_has_necessity_of(Service1, Service2, WindowStart, WindowEnd).
 % day(0..N).
 
-{ do(Patient, Packet, Day) } :-
-    patient_requests_protocol(Patient, _, _, Packet, StartDay, ExistenceStart, ExistenceEnd, Frequency, Tolerance),
-    day(Day), Day >= ExistenceStart, Day <= ExistenceEnd,
-    (Day - StartDay + Tolerance) \ Frequency <= (Tolerance * 2).
-
-protocol_window_done(Patient, Protocol, Iteration, 1..N, Packet) :-
-    patient_requests_protocol(Patient, Protocol, Iteration, Packet, StartDay, ExistenceStart, ExistenceEnd, Frequency, _),
-    N = (ExistenceEnd - StartDay + 1) / Frequency.
-
-% protocol_iteration_packet_done(Patient, Protocol, Iteration, Packet) :-
-%     patient_requests_protocol(Patient, Protocol, Iteration, Packet, StartDay, ExistenceStart, ExistenceEnd, Frequency, Tolerance),
+{ do(Patient, Packet, Day) } :- candidate(Patient, Packet, Day, _).
 
 % :- care_unit_has_daily_capacity(CareUnit, Day, Capacity),
 %     #sum { Duration,Patient,Service :
@@ -53,433 +48,723 @@ protocol_window_done(Patient, Protocol, Iteration, 1..N, Packet) :-
 #show do/3.
 """
 
-def solve_master_with_asp(full_input):
+# same constraints and objective of the MILP master, on the candidate days. Every aggregate is restricted
+# to the candidate days of a single day or of a single presolved range, so nothing is grounded over pairs of horizon days
+asp_constrained_program = """
+% window(Window, Patient, Packet).
+% window_day(Window, Day).
+% service_day(Patient, Service, Day).
+% packet_has_service(Packet, Service).
+% service(Service, CareUnit, Duration).
+% care_unit_has_daily_capacity(CareUnit, Day, Capacity).              only where it could be exceeded
+% interdiction(Patient, Service1, Service2, Day, FirstDay, LastDay).   Service2 cannot be done in the range if Service1 is done on Day
+% necessity(Patient, Service1, Service2, Day, FirstDay, LastDay).      Service2 must be done in the range if Service1 is done on Day
+
+{ do(Patient, Packet, Day) } :- window(Window, Patient, Packet), window_day(Window, Day).
+
+% each window is satisfied at most once
+:- window(Window, Patient, Packet), #count { Day : do(Patient, Packet, Day), window_day(Window, Day) } > 1.
+
+window_done(Window) :- window(Window, Patient, Packet), window_day(Window, Day), do(Patient, Packet, Day).
+
+% services can be done in their candidate days, and must be if a packet containing them is
+{ serve(Patient, Service, Day) } :- service_day(Patient, Service, Day).
+serve(Patient, Service, Day) :- do(Patient, Packet, Day), packet_has_service(Packet, Service).
+
+:- care_unit_has_daily_capacity(CareUnit, Day, Capacity),
+    #sum { Duration,Patient,Service : serve(Patient, Service, Day), service(Service, CareUnit, Duration) } > Capacity.
+
+:- serve(Patient, Service1, Day), interdiction(Patient, Service1, Service2, Day, FirstDay, LastDay),
+    serve(Patient, Service2, Day2), Day2 >= FirstDay, Day2 <= LastDay.
+
+:- serve(Patient, Service1, Day), necessity(Patient, Service1, Service2, Day, FirstDay, LastDay),
+    #count { Day2 : serve(Patient, Service2, Day2), Day2 >= FirstDay, Day2 <= LastDay } = 0.
+
+% maximize the number of windows satisfied
+:~ window_done(Window). [-1,Window]
+
+#show do/3.
+"""
+
+# requests in the master output format from the do/3 atoms (None for no answer)
+def get_asp_master_requests(atoms):
+    requests = dict()
+    if atoms is None:
+        return requests
+    for _, (patient_name, packet_name, day_name) in atoms:
+        day_name = f"{day_name}"
+        if day_name not in requests:
+            requests[day_name] = dict()
+        if patient_name not in requests[day_name]:
+            requests[day_name][patient_name] = {
+                'packets': []
+            }
+        requests[day_name][patient_name]['packets'].append(packet_name)
+    return requests
+
+# ASP master choosing among the candidate days of compute_candidate_days (computed if not given)
+def solve_master_with_asp(full_input, candidate_days=None):
+    if candidate_days is None:
+        candidate_days = compute_candidate_days(full_input)
 
     patient_names = set()
     service_names = set()
     packet_names = set()
     care_unit_names = set()
 
-    with open("input.lp", "w") as f:
-        for patient_name, patient in full_input['pat_request'].items():
-            patient_names.add(patient_name)
-            for protocol_name, protocol in patient.items():
-                if protocol_name == "priority_weight":
-                    continue
-                for iteration_name, iteration in protocol.items():
-                    initial_offset = iteration[1]
-                    for protocol_packet in iteration[0]:
-                        packet_name = protocol_packet['packet_id']
-                        packet_names.add(packet_name)
-                        for service_name in full_input['abstract_packet'][packet_name]:
-                            service_names.add(service_name)
-                            care_unit_names.add(full_input['services'][service_name]['careUnit'])
-                        f.write(f"patient_requests_protocol({patient_name}, {protocol_name}, {iteration_name}, {packet_name}, {protocol_packet['start_date'] + initial_offset}, {protocol_packet['existence'][0] + initial_offset}, {protocol_packet['existence'][1] + initial_offset}, {protocol_packet['freq']}, {protocol_packet['tolerance']}).\n")
+    facts = []
+    for patient_name, packet_name, day_name, window_index in candidate_days["candidates"]:
+        patient_names.add(patient_name)
+        packet_names.add(packet_name)
+        for service_name in full_input['abstract_packet'][packet_name]:
+            service_names.add(service_name)
+            care_unit_names.add(full_input['services'][service_name]['careUnit'])
+        facts.append(("candidate", [patient_name, packet_name, day_name, window_index]))
 
     patient_names = sorted(patient_names)
     service_names = sorted(service_names)
     packet_names = sorted(packet_names)
     care_unit_names = sorted(care_unit_names)
 
-    with open("input.lp", "a") as f:
-        for patient_name in patient_names:
-            f.write(f"patient_has_priority({patient_name}, {full_input['pat_request'][patient_name]['priority_weight']}).\n")
-
-    with open("input.lp", "a") as f:
-        for service_name in service_names:
-            f.write(f"service({service_name}, {full_input['services'][service_name]['careUnit']}, {full_input['services'][service_name]['duration']}).\n")
+    for patient_name in patient_names:
+        facts.append(("patient_has_priority", [patient_name, full_input['pat_request'][patient_name]['priority_weight']]))
 
-    with open("input.lp", "a") as f:
-        for packet_name in packet_names:
-            for service_name in full_input['abstract_packet'][packet_name]:
-                f.write(f"packet_has_service({packet_name}, {service_name}).\n")
+    for service_name in service_names:
+        facts.append(("service", [service_name, full_input['services'][service_name]['careUnit'], full_input['services'][service_name]['duration']]))
 
-    with open("input.lp", "a") as f:
-        for day_name, day in full_input['capacity'].items():
-            for care_unit_name in care_unit_names:
-                f.write(f"care_unit_has_daily_capacity({care_unit_name}, {int(day_name)}, {day[care_unit_name]}).\n")
+    for packet_name in packet_names:
+        for service_name in full_input['abstract_packet'][packet_name]:
+            facts.append(("packet_has_service", [packet_name, service_name]))
 
-    with open("input.lp", "a") as f:
-        for service_name in service_names:
-            for other_service_name, duration in full_input['interdiction'][service_name].items():
-                if duration == 0 or other_service_name not in service_names:
-                    continue
-                f.write(f"service_is_incompatible_with({service_name}, {other_service_name}, {duration}).\n")
+    for day_name, day in full_input['capacity'].items():
+        for care_unit_name in care_unit_names:
+            facts.append(("care_unit_has_daily_capacity", [care_unit_name, int(day_name), day[care_unit_name]]))
 
-    with open("input.lp", "a") as f:
-        for service_name in service_names:
-            for other_service_name, window in full_input['necessity'][service_name].items():
-                f.write(f"service_has_necessity_of({service_name}, {other_service_name}, {window[0]}, {window[1]}).\n")
+    for service_name in service_names:
+        for other_service_name, duration in full_input['interdiction'][service_name].items():
+            if duration == 0 or other_service_name not in service_names:
+                continue
+            facts.append(("service_is_incompatible_with", [service_name, other_service_name, duration]))
 
-    with open("input.lp", "a") as f:
-        f.write(f"day(0..{full_input['horizon'] - 1}).\n")
-    
-    with open("program.lp", "w") as f:
-        f.write(asp_program)
+    for service_name in service_names:
+        for other_service_name, window in full_input['necessity'][service_name].items():
+            facts.append(("service_has_necessity_of", [service_name, other_service_name, window[0], window[1]]))
 
-    with open("output.txt", "w") as f:
-        subprocess.run(["clingo", "input.lp", "program.lp"], stdout=f, stderr=subprocess.DEVNULL)
+    for day_name in range(full_input['horizon']):
+        facts.append(("day", [day_name]))
 
-    requests = dict()
-    with open("output.txt", "r") as f:
-        rows = f.read().split("Answer")[-1].split("\n")[1].split("do(")[1:]
-        rows[-1] += " "
-        for row in rows:
-            tokens = row.split(",")
-            tokens[2] = tokens[2][:-2]
-            day_name = f"{int(tokens[2])}"
-            if day_name not in requests:
-                requests[day_name] = dict()
-            if tokens[0] not in requests[day_name]:
-                requests[day_name][tokens[0]] = {
-                    'packets': []
-                }
-            requests[day_name][tokens[0]]['packets'].append(tokens[1])
-    return requests
+    atoms = solve_asp_program(asp_program, facts)
 
-def solve_master_with_milp(full_input, use_cores, print_flag=False, expand_cores=False):
-    care_units_touched_by_packet = dict()
-    for packet_name, packet in full_input['abstract_packet'].items():
-        care_units = set()
-        for service_name in packet:
-            care_units.add(full_input['services'][service_name]['careUnit'])
-        care_units_touched_by_packet[packet_name] = care_units
+    return get_asp_master_requests(atoms)
 
-    x_indexes = set()
-    l_indexes = set()
-    epsilon_indexes = set()
+# ASP master with capacities, interdictions and necessities, grounded on the presolved windows and ranges of the candidate days
+# (computed if not given). The search can be stopped after time_limit seconds (keeping the best solution found); if a statistics
+# dict is given, it is filled with the size of the ground program and the times
+def solve_master_with_constrained_asp(full_input, statistics=None, time_limit=None, candidate_days=None):
+    if candidate_days is None:
+        candidate_days = compute_candidate_days(full_input)
 
-    x_and_l_indexes = set()
-    capacity_indexes = set()
-    interdiction_indexes = set()
-    necessity_indexes = set()
-
-    for patient_name, patient in full_input['pat_request'].items():
-        # patient_priority = patient['priority_weight']
-        for protocol_name, protocol in patient.items():
-            if protocol_name == "priority_weight":
-                continue
-            for iteration_name, iteration in protocol.items():
-                initial_offset = iteration[1]
-                for protocol_packet in iteration[0]:
-                    packet_name = protocol_packet['packet_id']
-                    for perfect_day in range(protocol_packet['start_date'] + initial_offset, protocol_packet['existence'][1] + initial_offset + 1, protocol_packet['freq']):
-                        if perfect_day < protocol_packet['existence'][0] or perfect_day > protocol_packet['existence'][1]:
-                            continue
-                        there_is_at_least_one_day = False
-                        min_day = 10000
-                        max_day = -10000
-                        for day_name in range(perfect_day - protocol_packet['tolerance'], perfect_day + protocol_packet['tolerance'] + 1):
-                            if day_name >= full_input['horizon']:
-                                continue
-                            if day_name < protocol_packet['existence'][0] or day_name > protocol_packet['existence'][1]:
-                                continue
-                            is_packet_assignable = True
-                            temp_l_indexes = set()
-                            for service_name in full_input['abstract_packet'][packet_name]:
-                                service_care_unit = full_input['services'][service_name]['careUnit']
-                                service_duration = full_input['services'][service_name]['duration']
-                                if service_duration > full_input['capacity'][str(day_name)][service_care_unit]:
-                                # if service_duration > full_input['capacity'][str(day_name)][service_care_unit]:
-                                    is_packet_assignable = False
-                                    break
-                                temp_l_indexes.add((patient_name, service_name, day_name))
-                            if is_packet_assignable:
-                                x_indexes.add((patient_name, packet_name, day_name))
-                                l_indexes.update(temp_l_indexes)
-                                for care_unit_name in care_units_touched_by_packet[packet_name]:
-                                    capacity_indexes.add((day_name, care_unit_name))
-                                for patient_name1, service_name1, day_name1 in temp_l_indexes:
-                                    x_and_l_indexes.add((patient_name1, packet_name, service_name1, day_name1))
-                                there_is_at_least_one_day = True
-                                if day_name < min_day:
-                                    min_day = day_name
-                                if day_name > max_day:
-                                    max_day = day_name
-                        if there_is_at_least_one_day:
-                            epsilon_indexes.add((patient_name, packet_name, f"{protocol_name}__{iteration_name}__{min_day}__{max_day}"))
-
-    for service_name1, necessities in full_input['necessity'].items():
-        for service_name2, times in necessities.items():
-            if times[0] - 1 > full_input['interdiction'][service_name1][service_name2]:
-                full_input['interdiction'][service_name1][service_name2] = times[0] - 1
-            for patient_name3, service_name3, day_name3 in l_indexes:
-                    for patient_name4, service_name4, _ in l_indexes:
-                        if service_name3 == service_name1 and patient_name3 == patient_name4 and service_name4 == service_name2:
-                            necessity_indexes.add((patient_name3, service_name1, service_name2, day_name3))
-
-    for service_name1, interdictions in full_input['interdiction'].items():
-        for service_name2, time in interdictions.items():
-            if time > 0:
-                for patient_name3, service_name3, day_name3 in l_indexes:
-                    for patient_name4, service_name4, _ in l_indexes:
-                        if service_name3 == service_name1 and patient_name3 == patient_name4 and service_name4 == service_name2:
-                            interdiction_indexes.add((patient_name3, service_name1, service_name2, day_name3))
-
-    x_indexes = sorted(x_indexes)
-    l_indexes = sorted(l_indexes)
-    epsilon_indexes = sorted(epsilon_indexes)
-    x_and_l_indexes = sorted(x_and_l_indexes)
-    capacity_indexes = sorted(capacity_indexes)
-    interdiction_indexes = sorted(interdiction_indexes)
-    necessity_indexes = sorted(necessity_indexes)
+    facts = []
+    packet_names = set()
+    service_names = set()
+    for window_index, window in enumerate(candidate_days["windows"]):
+        facts.append(("window", [window_index, window["patient"], window["packet"]]))
+        for day_name in window["days"]:
+            facts.append(("window_day", [window_index, day_name]))
+        packet_names.add(window["packet"])
+    for patient_name, service_name, day_name in candidate_days["lIndexes"]:
+        facts.append(("service_day", [patient_name, service_name, day_name]))
+        service_names.add(service_name)
+    for packet_name in sorted(packet_names):
+        for service_name in full_input['abstract_packet'][packet_name]:
+            facts.append(("packet_has_service", [packet_name, service_name]))
+    for service_name in sorted(service_names):
+        facts.append(("service", [service_name, full_input['services'][service_name]['careUnit'], full_input['services'][service_name]['duration']]))
+    for day_name, care_unit_name in candidate_days["capacityIndexes"]:
+        facts.append(("care_unit_has_daily_capacity", [care_unit_name, day_name, full_input['capacity'][str(day_name)][care_unit_name]]))
+    for (patient_name, service_name1, service_name2, day_name), day_names in sorted(candidate_days["interdictions"].items()):
+        facts.append(("interdiction", [patient_name, service_name1, service_name2, day_name, day_names[0], day_names[-1]]))
+    for (patient_name, service_name1, service_name2, day_name), day_names in sorted(candidate_days["necessities"].items()):
+        facts.append(("necessity", [patient_name, service_name1, service_name2, day_name, day_names[0], day_names[-1]]))
+
+    atoms = solve_asp_program(asp_constrained_program, facts, statistics, time_limit)
+
+    return get_asp_master_requests(atoms)
+
+def get_presolve_report(model):
+    eliminated = model.presolve_eliminated
+    return (f"(presolve removed {eliminated['variables']} variables and {eliminated['constraints']} constraints: "
+        f"{eliminated['windows']} windows, {eliminated['x']} packet and {eliminated['l']} service assignments)")
+
+# the MILP master on the candidate days (computed if not given)
+def build_master_with_milp(full_input, candidate_days=None):
+    if candidate_days is None:
+        candidate_days = compute_candidate_days(full_input)
+    windows = candidate_days["windows"]
+    necessities = candidate_days["necessities"]
+    interdictions = candidate_days["interdictions"]
+    capacity_buckets = candidate_days["capacityBuckets"]
 
     model = ConcreteModel()
 
-    model.x_indexes = Set(initialize=x_indexes)
-    model.l_indexes = Set(initialize=l_indexes)
-    model.epsilon_indexes = Set(initialize=epsilon_indexes)
-    model.x_and_l_indexes = Set(initialize=x_and_l_indexes)
-    model.capacity_indexes = Set(initialize=capacity_indexes)
-    model.interdiction_indexes = Set(initialize=interdiction_indexes)
-    model.necessity_indexes = Set(initialize=necessity_indexes)
+    model.x_indexes = Set(initialize=candidate_days["xIndexes"])
+    model.l_indexes = Set(initialize=candidate_days["lIndexes"])
+    model.window_indexes = Set(initialize=range(len(windows)))
+    model.x_and_l_indexes = Set(initialize=candidate_days["xAndLIndexes"])
+    model.capacity_indexes = Set(initialize=candidate_days["capacityIndexes"])
+    model.interdiction_indexes = Set(initialize=sorted(interdictions.keys()))
+    model.necessity_indexes = Set(initialize=sorted(necessities.keys()))
 
-    del l_indexes, epsilon_indexes, x_and_l_indexes, capacity_indexes, interdiction_indexes, necessity_indexes
+    # what the presolve removed, for reporting
+    model.presolve_eliminated = candidate_days["eliminated"]
 
     model.x = Var(model.x_indexes, domain=Boolean)
     model.l = Var(model.l_indexes, domain=Boolean)
-    model.epsilon = Var(model.epsilon_indexes, domain=Boolean)
+    model.epsilon = Var(model.window_indexes, domain=Boolean)
 
     def ff(model):
-        return sum(model.epsilon[patient_name, packet_name, window_name] for patient_name, packet_name, window_name in model.epsilon_indexes)
+        return sum(model.epsilon[window_index] for window_index in model.window_indexes)
     model.objective = Objective(rule=ff, sense=maximize)
 
     def f1(model, patient_name, packet_name, service_name, day_name):
         return model.x[patient_name, packet_name, day_name] <= model.l[patient_name, service_name, day_name]
     model.x_and_l = Constraint(model.x_and_l_indexes, rule=f1)
 
-    def f2(model, patient_name, packet_name, window_name):
-        _, _, min_day, max_day = window_name.split("__")
-        return sum([model.x[patient_name, packet_name, day_name] for day_name in range(int(min_day), int(max_day) + 1) if (patient_name, packet_name, day_name) in model.x]) == model.epsilon[patient_name, packet_name, window_name]
-    model.x_and_epsilon = Constraint(model.epsilon_indexes, rule=f2)
+    def f2(model, window_index):
+        window = windows[window_index]
+        return sum([model.x[window["patient"], window["packet"], day_name] for day_name in window["days"]]) == model.epsilon[window_index]
+    model.x_and_epsilon = Constraint(model.window_indexes, rule=f2)
 
     def f3(model, day_name, care_unit_name):
         return (sum([model.l[patient_name, service_name, day_name] * full_input['services'][service_name]['duration']
-            for patient_name, service_name, day_name1 in model.l_indexes
-            if day_name1 == day_name and full_input['services'][service_name]['careUnit'] == care_unit_name]) <=
+            for patient_name, service_name, day_name in capacity_buckets[day_name, care_unit_name]]) <=
             full_input['capacity'][str(day_name)][care_unit_name])
     model.respect_capacity = Constraint(model.capacity_indexes, rule=f3)
 
     def f4(model, patient_name, service_name1, service_name2, day_name):
-        time = full_input['interdiction'][service_name1][service_name2]
-        day_names = []
-        for day_name2 in range(day_name + 1, day_name + time + 1):
-            if (patient_name, service_name2, day_name2) in model.l:
-                day_names.append(day_name2)
-        if len(day_names) == 0:
-            return Constraint.Skip
+        day_names = interdictions[patient_name, service_name1, service_name2, day_name]
         return sum([model.l[patient_name, service_name2, day_name2] for day_name2 in day_names]) <= (1 - model.l[patient_name, service_name1, day_name]) * len(day_names)
     model.interdictions = Constraint(model.interdiction_indexes, rule=f4)
 
-    impossible_assignments = set()
-
     def f5(model, patient_name, service_name1, service_name2, day_name):
-        times = full_input['necessity'][service_name1][service_name2]
-        day_names = []
-        for day_name2 in range(day_name + times[0], day_name + times[1] + 1):
-            if (patient_name, service_name2, day_name2) in model.l:
-                day_names.append(day_name2)
-        if len(day_names) == 0:
-            impossible_assignments.add((patient_name, service_name1, day_name))
-            return Constraint.Skip
+        day_names = necessities[patient_name, service_name1, service_name2, day_name]
         return sum([model.l[patient_name, service_name2, day_name2] for day_name2 in day_names]) >= model.l[patient_name, service_name1, day_name]
     model.necessities = Constraint(model.necessity_indexes, rule=f5)
 
-    for patient_name, service_name, day_name in impossible_assignments:
-        model.l[patient_name, service_name, day_name].fix(0)
-        for patient_name1, packet_name, day_name1 in model.x_indexes:
-            if patient_name1 == patient_name and day_name1 == day_name and service_name in full_input['abstract_packet'][packet_name]:
-                model.x[patient_name, packet_name, day_name].fix(0)
+    # container of all core constraints, filled across the solves
+    model.list = ConstraintList()
+    # variables of the aggregated core cuts, created along with them
+    model.core_y = Var(Any, dense=False, domain=Boolean)
+    model.core_cover = Var(Any, dense=False, domain=Boolean)
+    model.core_y_definitions = Constraint(Any)
+    model.core_cover_cuts = Constraint(Any)
+    # the ones created since the last load in a persistent solver
+    model.new_core_variables = []
+
+    return model
+
+# add a no-good cut on a [patient, service, day] list: not all of those services can be done together. Returns the new constraints
+# (none if some of the services was removed by the presolve, since the cut is then always satisfied)
+def add_list_cut(model, core_list):
+    indexes = []
+    for core_constraint in core_list:
+        indexes.append((core_constraint[0], core_constraint[1], int(core_constraint[2])))
+    if any(index not in model.l for index in indexes):
+        return []
+    return [model.list.add(expr=sum(model.l[p, s, d] for (p, s, d) in indexes) <= len(indexes) - 1)]
+
+# the variable of an aggregated cut at index, created (and tracked for the persistent solver) if it does not exist yet
+def get_core_variable(model, variable, index):
+    if index not in variable:
+        model.new_core_variables.append(variable[index])
+    return variable[index]
+
+# one cut equivalent to all the expanded ones of a core day: multipackets is a list of [services, patients that could receive them].
+# core_y[p, m, d] is 1 if patient p receives all the services of multipacket m on day d. Expanded cuts forbid every choice of
+# distinct patients receiving all the multipackets, that is a matching of all the multipackets in the bipartite graph with the y
+# edges; by Konig theorem none exists if and only if the graph has a vertex cover (core_cover) smaller than the multipackets.
+# Returns the new constraints (none if the cut is already in the model)
+def add_aggregated_cut(model, day_name, multipackets):
+    constraints = []
+    multipacket_names = sorted("_".join(services) for services, _ in multipackets)
+    cut_name = f"{day_name}__{'__'.join(multipacket_names)}"
+    if (cut_name, "size") in model.core_cover_cuts:
+        return constraints
+    cover_indexes = set()
+    for services, patients in multipackets:
+        multipacket_name = "_".join(services)
+        multipacket_cover = get_core_variable(model, model.core_cover, (cut_name, "multipacket", multipacket_name))
+        cover_indexes.add((cut_name, "multipacket", multipacket_name))
+        for patient_name in patients:
+            if any((patient_name, service_name, int(day_name)) not in model.l for service_name in services):
+                continue # removed by the presolve: the patient cannot receive the multipacket
+            y_index = (patient_name, multipacket_name, int(day_name))
+            if y_index not in model.core_y: # indicators are shared by all the cuts
+                model.core_y_definitions[y_index] = get_core_variable(model, model.core_y, y_index) >= sum(model.l[patient_name, service_name, int(day_name)] for service_name in services) - len(services) + 1
+                constraints.append(model.core_y_definitions[y_index])
+            patient_cover = get_core_variable(model, model.core_cover, (cut_name, "patient", patient_name))
+            cover_indexes.add((cut_name, "patient", patient_name))
+            model.core_cover_cuts[cut_name, multipacket_name, patient_name] = model.core_y[y_index] <= multipacket_cover + patient_cover
+            constraints.append(model.core_cover_cuts[cut_name, multipacket_name, patient_name])
+    model.core_cover_cuts[cut_name, "size"] = sum(model.core_cover[index] for index in sorted(cover_indexes)) <= len(multipackets) - 1
+    constraints.append(model.core_cover_cuts[cut_name, "size"])
+    return constraints
+
+# a cut is a (kind, data) tuple: ("list", [[patient, service, day], ...]) or ("aggregated", [day, [[services, patients], ...]])
+def add_core_cut(model, cut):
+    kind, data = cut
+    if kind == "list":
+        return add_list_cut(model, data)
+    return add_aggregated_cut(model, data[0], data[1])
+
+# take a cut out of a persistent master (shared aggregated indicators are kept)
+def remove_core_cut_constraints(model, opt, solver, constraints):
+    constraints = [constraint for constraint in constraints if constraint.parent_component() is not model.core_y_definitions]
+    if solver["solver"] == "highs":
+        opt.remove_constraints(constraints)
+    else:
+        for constraint in constraints:
+            opt.remove_constraint(constraint)
+    for constraint in constraints:
+        if constraint.parent_component() is model.core_cover_cuts:
+            del model.core_cover_cuts[constraint.index()]
+        else:
+            constraint.deactivate()
+
+# the cuts derived from the new cores. Aggregated cuts carry the same information of the expanded ones
+# with a size linear in the number of patients
+def get_core_cuts(model, full_input, cores, expand_cores=False, aggregate_cores=False):
+    cuts = []
+    for core in cores.values():
+        for day_name in core["days"]:
+            patient_services = dict()
+            for x_index in model.x_indexes:
+                if x_index[2] != int(day_name):
+                    continue
+                if x_index[0] not in patient_services:
+                    patient_services[x_index[0]] = set()
+                for service_name in full_input["abstract_packet"][x_index[1]]:
+                    patient_services[x_index[0]].add(service_name)
+            for patient_name, service_list in patient_services.items():
+                patient_services[patient_name] = sorted(service_list)
+            who_could_be = []
+            total_durations: dict[str, int] = dict()
+            for multipacket_name, multipacket in core["multipackets"].items():
+                for service_name in multipacket["services"]:
+                    care_unit_name = full_input["services"][service_name]["careUnit"]
+                    duration = full_input["services"][service_name]["duration"]
+                    if care_unit_name not in total_durations:
+                        total_durations[care_unit_name] = 0
+                    total_durations[care_unit_name] += duration
+                patient_list = []
+                for patient_name, service_list in patient_services.items():
+                    is_contained = True
+                    for service_name in multipacket["services"]:
+                        if service_name not in service_list:
+                            is_contained = False
+                            break
+                    if is_contained:
+                        patient_list.append(patient_name)
+                who_could_be.append({
+                    "name": multipacket_name,
+                    "patients": patient_list
+                })
+            # check on care_unit sum, in order to not add something already seen
+            is_day_valid = True
+            for care_unit_name, duration in total_durations.items():
+                if duration > full_input["capacity"][day_name][care_unit_name]:
+                    is_day_valid = False
+                    break
+            if not is_day_valid:
+                continue
+            # who_could_be = [
+            #     {"name": 'srv01_srv05', "patients": ['pat00', 'pat03', 'pat05']},
+            #     {"name": 'srv05', "patients": ['pat00', 'pat01']},
+            #     {"name": 'srv07', "patients": ['pat06', 'pat12', 'pat22']}
+            # ]
+            # print(who_could_be)
+            if aggregate_cores:
+                if any(len(multipacket["patients"]) == 0 for multipacket in who_could_be):
+                    continue # some multipacket cannot be received by anyone: nothing to forbid
+                multipackets = [[core["multipackets"][multipacket["name"]]["services"], multipacket["patients"]] for multipacket in who_could_be]
+                cuts.append(("aggregated", [day_name, multipackets]))
+            elif expand_cores:
+                choice_indexes = []
+                for _ in who_could_be:
+                    choice_indexes.append(0)
+                def get_next(value3: list[int]=None):
+                    if value3 is None:
+                        return [0 for _ in who_could_be]
+                    index = 0
+                    while index < len(who_could_be):
+                        value3[index] += 1
+                        if value3[index] < len(who_could_be[index]["patients"]):
+                            return value3
+                        value3[index] = 0
+                        index += 1
+                    return None
+                value2 = get_next()
+                while value2 is not None:
+                    actual_value = []
+                    for value_index in range(len(value2)):
+                        actual_value.append(who_could_be[value_index]["patients"][value2[value_index]])
+                    # check for repetitions...
+                    is_valid_value = len(set(actual_value)) == len(actual_value)
+                    if is_valid_value:
+                        # add index at the day 'day_name' for patients in the index
+                        core_list = []
+                        for index in range(len(actual_value)):
+                            for service_name in core["multipackets"][who_could_be[index]["name"]]["services"]:
+                                core_list.append([actual_value[index], service_name, day_name])
+                        cuts.append(("list", core_list))
+                    value2 = get_next(value2)
+            else:
+                for multipacket in core["multipackets"].values():
+                    for patient_name, packet_list in multipacket["actual"].items():
+                        expr_indexes = set()
+                        core_list = []
+                        for packet_name in packet_list:
+                            for service_name in full_input["abstract_packet"][packet_name]:
+                                expr_indexes.add((patient_name, service_name))
+                        if any((p, s, int(day_name)) not in model.l for (p, s) in expr_indexes):
+                            continue # the patient cannot receive these services on this day
+                        for index in sorted(expr_indexes):
+                            core_list.append([index[0], index[1], day_name])
+                        cuts.append(("list", core_list))
+    return cuts
+
+# decode the master solution in the requests format
+def get_master_requests(model):
+    return get_requests_from_x_indexes(index for index in model.x_indexes if value(model.x[index]) > 0.5)
+
+# requests in the master output format from the (patient, packet, day) assignments done
+def get_requests_from_x_indexes(x_indexes):
+    requests = dict()
+    for patient_name, packet_name, day_name in x_indexes:
+        if day_name not in requests:
+            requests[day_name] = dict()
+        if patient_name not in requests[day_name]:
+            requests[day_name][patient_name] = {
+                'packets': []
+            }
+        requests[day_name][patient_name]['packets'].append(packet_name)
+    return requests
+
+# create a solver (with the settings of get_solver_settings) that keeps the model loaded between solves;
+# cuts must be passed to solve_persistent_master
+def create_persistent_master_solver(model, solver):
+    opt = create_solver(solver, persistent=True)
+    if solver["solver"] == "highs":
+        # the model changes only through added cuts, so there is no need to look for modifications
+        opt.update_config.check_for_new_or_removed_constraints = False
+        opt.update_config.check_for_new_or_removed_vars = False
+        opt.update_config.check_for_new_or_removed_params = False
+        opt.update_config.check_for_new_objective = False
+        opt.update_config.update_constraints = False
+        opt.update_config.update_vars = False
+        opt.update_config.update_params = False
+        opt.update_config.update_named_expressions = False
+        opt.update_config.update_objective = False
+    opt.set_instance(model)
+    model.new_core_variables.clear() # already loaded
+    return opt
+
+# solve again a persistent master after loading the constraints added since the last solve.
+# If an outcome dict is given, it is filled with the status, incumbent and bound of the solve
+def solve_persistent_master(model, opt, solver, new_constraints=(), outcome=None):
+    if solver["solver"] == "highs":
+        opt.add_constraints(list(new_constraints)) # appsi loads the new variables of the constraints by itself
+    else:
+        for variable in model.new_core_variables: # aggregated cuts bring their own variables
+            opt.add_var(variable)
+        for constraint in new_constraints:
+            opt.add_constraint(constraint)
+    model.new_core_variables.clear()
+    solve_outcome = solve_persistent_model(model, opt)
+    if outcome is not None:
+        outcome.update(solve_outcome)
+    if not solve_outcome["hasSolution"]:
+        return {}
+    return get_master_requests(model)
+
+# core_pool.json and cores.json are read from (and written to) the instance folder; an old prev_cores.json is moved in the pool.
+# After the solve, the cuts not binding for pool_max_idle solves can be removed to keep at most pool_max_size of them.
+# The solver settings come from get_solver_settings (gurobi with its defaults if None)
+def solve_master_with_milp(full_input, use_cores, print_flag=False, expand_cores=False, solver=None, instance_path=".",
+        aggregate_cores=False, pool_max_idle=5, pool_max_size=None, verbose=False, candidate_days=None):
+    if solver is None:
+        solver = get_solver_settings()
+    model = build_master_with_milp(full_input, candidate_days)
+    if verbose:
+        print(get_presolve_report(model), end=" ")
 
-    # print(use_cores)
     if use_cores:
-        # print("HI")
-        # add core constraints
-        model.list = ConstraintList()
-        if os.path.isfile("prev_cores.json"):
-            with open("prev_cores.json", "r") as f:
-                prev_cores = json.load(f)
-            for prev_core in prev_cores["list"]:
-                indexes = []
-                for core_constraint in prev_core:
-                    indexes.append((core_constraint[0], core_constraint[1], core_constraint[2]))
-                model.list.add(expr=sum(model.l[p, s, int(d)] for (p, s, d) in indexes) <= len(indexes) - 1)
+        pool_path = os.path.join(instance_path, "core_pool.json")
+        prev_cores_path = os.path.join(instance_path, "prev_cores.json")
+        cores_path = os.path.join(instance_path, "cores.json")
+        if os.path.isfile(pool_path):
+            pool = load_core_pool(pool_path)
+        elif os.path.isfile(prev_cores_path):
+            with open(prev_cores_path, "r") as f:
+                pool = create_core_pool_from_prev_cores(json.load(f))
         else:
-            prev_cores = {"list": []}
-        if os.path.isfile("cores.json"):
-            with open("cores.json", "r") as f:
+            pool = create_core_pool()
+        for entry in pool["cuts"].values():
+            add_core_cut(model, entry["cut"])
+        if os.path.isfile(cores_path):
+            with open(cores_path, "r") as f:
                 cores = json.load(f)
-            for core in cores.values():
-                for day_name in core["days"]:
-                    patient_services = dict()
-                    for x_index in x_indexes:
-                        if x_index[2] != int(day_name):
-                            continue
-                        if x_index[0] not in patient_services:
-                            patient_services[x_index[0]] = set()
-                        for service_name in full_input["abstract_packet"][x_index[1]]:
-                            patient_services[x_index[0]].add(service_name)
-                    for patient_name, service_list in patient_services.items():
-                        patient_services[patient_name] = sorted(service_list)
-                    who_could_be = []
-                    total_durations: dict[str, int] = dict()
-                    for multipacket_name, multipacket in core["multipackets"].items():
-                        patient_list = []
-                        for patient_name, service_list in patient_services.items():
-                            is_contained = True
-                            for service_name in multipacket["services"]:
-                                care_unit_name = full_input["services"][service_name]["careUnit"]
-                                duration = full_input["services"][service_name]["duration"]
-                                if care_unit_name not in total_durations:
-                                    total_durations[care_unit_name] = 0
-                                total_durations[care_unit_name] += duration
-                                if service_name not in service_list:
-                                    is_contained = False
-                                    break
-                            if is_contained:
-                                patient_list.append(patient_name)
-                        who_could_be.append({
-                            "name": multipacket_name,
-                            "patients": patient_list
-                        })
-                    # check on care_unit sum, in order to not add something already seen
-                    is_day_valid = True
-                    for care_unit_name, duration in total_durations.items():
-                        if duration > full_input["capacity"][day_name][care_unit_name]:
-                            is_day_valid = False
-                            break
-                    if not is_day_valid:
-                        continue
-                    # who_could_be = [
-                    #     {"name": 'srv01_srv05', "patients": ['pat00', 'pat03', 'pat05']},
-                    #     {"name": 'srv05', "patients": ['pat00', 'pat01']},
-                    #     {"name": 'srv07', "patients": ['pat06', 'pat12', 'pat22']}
-                    # ]
-                    # print(who_could_be)
-                    if expand_cores:
-                        choice_indexes = []
-                        for _ in who_could_be:
-                            choice_indexes.append(0)
-                        def get_next(value3: list[int]=None):
-                            if value3 is None:
-                                return [0 for _ in who_could_be]
-                            index = 0
-                            while index < len(who_could_be):
-                                value3[index] += 1
-                                if value3[index] < len(who_could_be[index]["patients"]):
-                                    return value3
-                                value3[index] = 0
-                                index += 1
-                            return None
-                        value2 = get_next()
-                        while value2 is not None:
-                            actual_value = []
-                            for value_index in range(len(value2)):
-                                actual_value.append(who_could_be[value_index]["patients"][value2[value_index]])
-                            # check for repetitions...
-                            is_valid_value = len(set(actual_value)) == len(actual_value)
-                            if is_valid_value:
-                                # add index at the day 'day_name' for patients in the index
-                                expr_indexes = []
-                                core_list = []
-                                for index in range(len(actual_value)):
-                                    for service_name in core["multipackets"][who_could_be[index]["name"]]["services"]:
-                                        expr_indexes.append((actual_value[index], service_name))
-                                        core_list.append([actual_value[index], service_name, day_name])
-                                model.list.add(expr=sum(model.l[p, s, int(day_name)] for (p, s) in expr_indexes) <= len(expr_indexes) - 1)
-                                prev_cores["list"].append(core_list)
-                            value2 = get_next(value2)
-                    else:
-                        for multipacket in core["multipackets"].values():
-                            for patient_name, packet_list in multipacket["actual"]:
-                                expr_indexes = set()
-                                for packet_name in packet_list:
-                                    for service_name in full_input["abstract_packet"][packet_name]:
-                                        expr_indexes.add((patient_name, service_name))
-                                for index in expr_indexes:
-                                    core_list.append([index[0], index[1], day_name])
-                                model.list.add(expr=sum(model.l[p, s, int(day_name)] for (p, s) in expr_indexes) <= len(expr_indexes) - 1)
-                                prev_cores["list"].append(core_list)
-            with open("prev_cores.json", "w") as f:
-                # print("writing")
-                # print(prev_cores)
-                json.dump(prev_cores, f)
-            os.remove("cores.json")
-    
-    
-    opt = SolverFactory('gurobi')
-    result = opt.solve(model)
- 
+            for cut in get_core_cuts(model, full_input, cores, expand_cores, aggregate_cores):
+                if add_pool_cut(pool, cut) is not None:
+                    add_core_cut(model, cut)
+
+    outcome = solve_model(model, solver)
+    if verbose:
+        print(f"({get_outcome_report(outcome)})", end=" ")
+
     if print_flag:
         model.pprint()
 
-    requests = dict()
-    if result.solver.termination_condition == TerminationCondition.infeasible:
-        requests = {}
-    else:
-        for patient_name, packet_name, day_name in model.x_indexes:
-            if value(model.x[patient_name, packet_name, day_name]) == 0:
-                continue
-            if day_name not in requests:
-                requests[day_name] = dict()
-            if patient_name not in requests[day_name]:
-                requests[day_name][patient_name] = {
-                    'packets': []
-                }
-            requests[day_name][patient_name]['packets'].append(packet_name)
-    return requests
+    is_infeasible = not outcome["hasSolution"]
+
+    if use_cores:
+        if not is_infeasible:
+            update_core_pool(pool, model)
+            evict_pool_cuts(pool, pool_max_idle, pool_max_size)
+        save_core_pool(pool, pool_path)
+        if os.path.isfile(prev_cores_path):
+            os.remove(prev_cores_path)
+        if os.path.isfile(cores_path):
+            os.remove(cores_path)
+
+    if is_infeasible:
+        return {}
+    return get_master_requests(model)
+
+# group the candidate days by day, so that the data of a range of days is read without scanning the whole horizon:
+# day -> x indexes, l indexes, windows, capacities, interdictions and necessities with some variable on that day
+def get_candidate_days_by_day(candidate_days):
+    by_day = dict()
+    def add(day_name, field, item):
+        if day_name not in by_day:
+            by_day[day_name] = {"x": [], "l": [], "windows": [], "capacities": [], "interdictions": [], "necessities": []}
+        by_day[day_name][field].append(item)
+    for x_index in candidate_days["xIndexes"]:
+        add(x_index[2], "x", x_index)
+    for l_index in candidate_days["lIndexes"]:
+        add(l_index[2], "l", l_index)
+    for window_index, window in enumerate(candidate_days["windows"]):
+        for day_name in window["days"]:
+            add(day_name, "windows", window_index)
+    for capacity_index in candidate_days["capacityIndexes"]:
+        add(capacity_index[0], "capacities", capacity_index)
+    for field in ("interdictions", "necessities"):
+        for index, day_names in candidate_days[field].items():
+            for day_name in set([index[3]] + day_names):
+                add(day_name, field, index)
+    return by_day
+
+# MILP master restricted to the days in [first_day, last_day]. The assignments of the days before are fixed to the committed ones
+# (sets of x and l indexes done) and enter the constraints as constants, while the days after are not seen: a necessity can only
+# be met inside the range, so that a solution stays feasible when the next range is added. Windows already done before first_day
+# keep their epsilon forced to 1
+def build_rolling_master_with_milp(full_input, candidate_days, by_day, first_day, last_day, committed_x_indexes, committed_l_indexes):
+    windows = candidate_days["windows"]
+    necessities = candidate_days["necessities"]
+    interdictions = candidate_days["interdictions"]
+    capacity_buckets = candidate_days["capacityBuckets"]
+
+    x_indexes = []
+    l_indexes = []
+    window_indexes = set()
+    capacity_indexes = []
+    interdiction_indexes = set()
+    necessity_indexes = set()
+    for day_name in range(first_day, last_day + 1):
+        if day_name not in by_day:
+            continue
+        x_indexes.extend(by_day[day_name]["x"])
+        l_indexes.extend(by_day[day_name]["l"])
+        window_indexes.update(by_day[day_name]["windows"])
+        capacity_indexes.extend(by_day[day_name]["capacities"])
+        interdiction_indexes.update(by_day[day_name]["interdictions"])
+        necessity_indexes.update(by_day[day_name]["necessities"])
+
+    model = ConcreteModel()
+
+    model.x_indexes = Set(initialize=sorted(x_indexes))
+    model.l_indexes = Set(initialize=sorted(l_indexes))
+    model.window_indexes = Set(initialize=sorted(window_indexes))
+    model.x_and_l_indexes = Set(initialize=[(patient_name, packet_name, service_name, day_name) for patient_name, packet_name, day_name in sorted(x_indexes)
+        for service_name in full_input['abstract_packet'][packet_name]])
+    model.capacity_indexes = Set(initialize=capacity_indexes)
+    model.interdiction_indexes = Set(initialize=sorted(interdiction_indexes))
+    model.necessity_indexes = Set(initialize=sorted(necessity_indexes))
+
+    model.x = Var(model.x_indexes, domain=Boolean)
+    model.l = Var(model.l_indexes, domain=Boolean)
+    model.epsilon = Var(model.window_indexes, domain=Boolean)
+
+    # value of an x or l assignment: a variable inside the range, the committed value before it, 0 after it
+    def get_x(patient_name, packet_name, day_name):
+        if day_name < first_day:
+            return 1 if (patient_name, packet_name, day_name) in committed_x_indexes else 0
+        if day_name > last_day:
+            return 0
+        return model.x[patient_name, packet_name, day_name]
+    def get_l(patient_name, service_name, day_name):
+        if day_name < first_day:
+            return 1 if (patient_name, service_name, day_name) in committed_l_indexes else 0
+        if day_name > last_day:
+            return 0
+        return model.l[patient_name, service_name, day_name]
+
+    def ff(model):
+        return sum(model.epsilon[window_index] for window_index in model.window_indexes)
+    model.objective = Objective(rule=ff, sense=maximize)
+
+    def f1(model, patient_name, packet_name, service_name, day_name):
+        return model.x[patient_name, packet_name, day_name] <= model.l[patient_name, service_name, day_name]
+    model.x_and_l = Constraint(model.x_and_l_indexes, rule=f1)
+
+    def f2(model, window_index):
+        window = windows[window_index]
+        return sum([get_x(window["patient"], window["packet"], day_name) for day_name in window["days"]]) == model.epsilon[window_index]
+    model.x_and_epsilon = Constraint(model.window_indexes, rule=f2)
+
+    def f3(model, day_name, care_unit_name):
+        return (sum([model.l[patient_name, service_name, day_name] * full_input['services'][service_name]['duration']
+            for patient_name, service_name, day_name in capacity_buckets[day_name, care_unit_name]]) <=
+            full_input['capacity'][str(day_name)][care_unit_name])
+    model.respect_capacity = Constraint(model.capacity_indexes, rule=f3)
+
+    def f4(model, patient_name, service_name1, service_name2, day_name):
+        day_names = interdictions[patient_name, service_name1, service_name2, day_name]
+        if day_name < first_day and (patient_name, service_name1, day_name) not in committed_l_indexes:
+            return Constraint.Skip
+        return sum([get_l(patient_name, service_name2, day_name2) for day_name2 in day_names]) <= (1 - get_l(patient_name, service_name1, day_name)) * len(day_names)
+    model.interdictions = Constraint(model.interdiction_indexes, rule=f4)
+
+    def f5(model, patient_name, service_name1, service_name2, day_name):
+        day_names = necessities[patient_name, service_name1, service_name2, day_name]
+        if day_name < first_day and (patient_name, service_name1, day_name) not in committed_l_indexes:
+            return Constraint.Skip
+        return sum([get_l(patient_name, service_name2, day_name2) for day_name2 in day_names]) >= get_l(patient_name, service_name1, day_name)
+    model.necessities = Constraint(model.necessity_indexes, rule=f5)
+
+    return model
+
+# Rolling-horizon MILP master: the horizon is solved in ranges of window_length days, each one starting overlap days before
+# the end of the previous one. The days before the start of the next range are committed, the others are solved again with
+# the next range. Every range model only holds its own days, so memory and time grow linearly with the horizon.
+# Returns the requests and, for each range, its days, model size, times and solver outcome. If a range has no solution the
+# requests of the days committed before it are returned with the ranges solved so far
+def solve_master_with_rolling_horizon(full_input, window_length, overlap, solver=None, candidate_days=None):
+    if solver is None:
+        solver = get_solver_settings()
+    if candidate_days is None:
+        candidate_days = compute_candidate_days(full_input)
+    by_day = get_candidate_days_by_day(candidate_days)
+
+    committed_x_indexes = set()
+    committed_l_indexes = set()
+    ranges = []
+    first_day = 0
+    while first_day < full_input['horizon']:
+        last_day = min(first_day + window_length, full_input['horizon']) - 1
+        if last_day == full_input['horizon'] - 1:
+            next_first_day = full_input['horizon']
+        else:
+            next_first_day = last_day + 1 - overlap
+
+        start_time = datetime.now()
+        model = build_rolling_master_with_milp(full_input, candidate_days, by_day, first_day, last_day, committed_x_indexes, committed_l_indexes)
+        build_end_time = datetime.now()
+        outcome = solve_model(model, solver)
+        solve_end_time = datetime.now()
+        if not outcome["hasSolution"]: # the days committed so far are kept, the rest of the horizon is left without requests
+            print(f"range of days {first_day}-{last_day} has no solution ({get_outcome_report(outcome)}), stopping", end=" ")
+            return get_requests_from_x_indexes(committed_x_indexes), ranges
+
+        for x_index in model.x_indexes:
+            if x_index[2] < next_first_day and value(model.x[x_index]) > 0.5:
+                committed_x_indexes.add(x_index)
+        for l_index in model.l_indexes:
+            if l_index[2] < next_first_day and value(model.l[l_index]) > 0.5:
+                committed_l_indexes.add(l_index)
+
+        ranges.append({
+            "firstDay": first_day,
+            "lastDay": last_day,
+            "variables": len(model.x_indexes) + len(model.l_indexes) + len(model.window_indexes),
+            "buildTime": (build_end_time - start_time).total_seconds(),
+            "solvingTime": (solve_end_time - build_end_time).total_seconds(),
+            "outcome": outcome
+        })
+        first_day = next_first_day
+
+    return get_requests_from_x_indexes(committed_x_indexes), ranges
+
+def process_instance(instance_path, args):
+    with open(os.path.join(instance_path, "full_input.json"), "r") as f:
+        full_input = json.load(f)
+    start_time = datetime.now()
+    solver = get_solver_settings(args.solver, args.solver_time_limit, args.mip_gap, args.threads)
+    # shared by all the methods and by the master solves of every core iteration
+    candidate_days = get_candidate_days(full_input, os.path.join(instance_path, "candidate_days.json"))
+    if args.method == "asp":
+        requests = solve_master_with_asp(full_input, candidate_days)
+    elif args.method == "asp_constrained":
+        requests = solve_master_with_constrained_asp(full_input, time_limit=args.time_limit, candidate_days=candidate_days)
+    elif args.method == "milp" and args.rolling_horizon is not None:
+        requests, ranges = solve_master_with_rolling_horizon(full_input, args.rolling_horizon, args.rolling_overlap, solver, candidate_days)
+        if args.verbose and args.jobs <= 1:
+            print(f"({len(ranges)} ranges, at most {max((entry['variables'] for entry in ranges), default=0)} variables)", end=" ")
+    elif args.method == "milp":
+        requests = solve_master_with_milp(full_input, args.use_cores, False, args.expand_cores, solver, instance_path, args.aggregate_cores,
+            args.pool_max_idle, args.pool_max_size, args.verbose and args.jobs <= 1, candidate_days)
+    end_time = datetime.now()
+    with open(os.path.join(instance_path, "requests.json"), "w") as f:
+        json.dump(requests, f, indent=4, sort_keys=True)
+    return (end_time - start_time).total_seconds()
 
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description="Solve master problem instances")
-    parser.add_argument("-m", "--method", metavar="MET", type=str, default="asp", choices=["asp", "milp"], help="solution method used (asp|milp)")
+    parser.add_argument("-m", "--method", metavar="MET", type=str, default="asp", choices=["asp", "asp_constrained", "milp"], help="solution method used (asp|asp_constrained|milp)")
     parser.add_argument("-i", "--input", metavar="IN", type=str, default="instances", help="input folder with the instances")
     parser.add_argument("--use-cores", action="store_true", help="use cores from prev solves")
     parser.add_argument("--expand-cores", action="store_true", help="infer all information from cores")
+    parser.add_argument("--aggregate-cores", action="store_true", help="infer all information from cores with one compact cut per core day (overrides --expand-cores)")
+    parser.add_argument("--pool-max-size", metavar="NUM", type=int, default=None, help="maximum number of cuts kept in the core pool")
+    parser.add_argument("--pool-max-idle", metavar="NUM", type=int, default=5, help="only cuts not binding for these many solves can be evicted from the pool")
+    parser.add_argument("--time-limit", metavar="SEC", type=float, default=None, help="stop the asp_constrained search after these many seconds, keeping the best solution found")
+    parser.add_argument("--rolling-horizon", metavar="DAYS", type=int, default=None, help="solve the milp master in ranges of these many days, committing them one after the other")
+    parser.add_argument("--rolling-overlap", metavar="DAYS", type=int, default=7, help="days of each range solved again with the next one")
+    parser.add_argument("-s", "--solver", metavar="SOL", type=str, default="gurobi", choices=list(solver_backends.keys()), help="MILP solver used (gurobi|highs|cbc)")
+    parser.add_argument("--solver-time-limit", metavar="SEC", type=float, default=None, help="stop each MILP solve after these many seconds, keeping the best solution found")
+    parser.add_argument("--mip-gap", metavar="GAP", type=float, default=None, help="relative gap at which the MILP solves stop")
+    parser.add_argument("--threads", metavar="NUM", type=int, default=None, help="threads used by the MILP solver")
+    parser.add_argument("-j", "--jobs", metavar="NUM", type=int, default=1, help="number of instances processed in parallel")
     parser.add_argument("-v", "--verbose", action="store_true", help="show what is done")
     args = parser.parse_args(sys.argv[1:])
 
-    os.chdir(os.path.dirname(os.path.abspath(sys.argv[0])))
+    if args.pool_max_idle < 1:
+        parser.error("--pool-max-idle must be at least 1")
+    if args.rolling_horizon is not None:
+        if args.use_cores:
+            parser.error("--rolling-horizon cannot be used with --use-cores")
+        if args.rolling_overlap < 0 or args.rolling_overlap >= args.rolling_horizon:
+            parser.error("--rolling-overlap must be at least 0 and less than --rolling-horizon")
 
-    if not os.path.isdir(args.input):
-        raise FileNotFoundError(f"Input folder '{args.input}' not found")
-    os.chdir(args.input)
+    instance_paths = get_instance_paths(get_folder_path(sys.argv[0], args.input))
 
-    instance_number = len(os.listdir("."))
+    instance_number = len(instance_paths)
     if instance_number == 0:
         print("No instance folder found. No action taken.")
         exit(0)
 
-    if args.verbose:
-        total_time = 0
-
-    for folder_name in sorted(os.listdir(".")):
-        os.chdir(folder_name)
-        if args.verbose:
-            print(f"Read instance '{folder_name}' ... ", end=" ")
-        with open("full_input.json", "r") as f:
-            full_input = json.load(f)
-        if args.verbose:
-            start_time = datetime.now()
-        if args.method == "asp":
-            requests = solve_master_with_asp(full_input)
-        elif args.method == "milp":
-            requests = solve_master_with_milp(full_input, args.use_cores, False, args.expand_cores)
-        if args.verbose:
-            end_time = datetime.now()
-        with open("requests.json", "w") as f:
-            json.dump(requests, f, indent=4, sort_keys=True)
-        if args.verbose:
-            delta = (end_time - start_time).total_seconds()
-            print(f"finished! Time taken: {delta}s")
-            total_time += delta
-        if os.path.isfile("input.lp"):
-            os.remove("input.lp")
-        if os.path.isfile("program.lp"):
-            os.remove("program.lp")
-        if os.path.isfile("output.txt"):
-            os.remove("output.txt")
-        os.chdir("..")
+    total_time = run_on_instances(process_instance, instance_paths, args)
 
     if args.verbose:
-        print(f"Solved master problem for {instance_number} instance(s). Total time taken: {total_time}s, average: {total_time / instance_number}s")
\ No newline at end of file
+        print(f"Solved master problem for {instance_number} instance(s). Total time taken: {total_time}s, average: {total_time / instance_number}s")
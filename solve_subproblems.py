@@ -2,13 +2,20 @@ import os
 import sys
 import json
 import argparse
-import subprocess
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 
-from pyomo.environ import ConcreteModel, SolverFactory, maximize, TerminationCondition
+from pyomo.environ import ConcreteModel, maximize
 from pyomo.environ import Set, Var, Objective, Constraint
 from pyomo.environ import Boolean, NonNegativeIntegers, value
 
+from clingo_backend import solve_asp_program
+from solvers import solver_backends, get_solver_settings, solve_model
+from instance_runner import get_folder_path, get_instance_paths, run_on_instances
+from validate_results import analyze_day
+from compute_cores import find_root, join_roots
+from subproblem_cache import get_day_key, load_cache, save_cache, get_cached_day, put_cached_day
+
 asp_program = """
 % variable for the assignment of services
 { do(Patient, Service, Operator, CareUnit, Time) } :-
@@ -52,7 +59,82 @@ asp_program = """
 #show do/5.
 """
 
-def solve_day_with_asp(day_name, services, packets, operators, priorities, requests):
+# identical operators and patients are interchangeable: only the solutions where the first one
+# of each pair has the greater load (operators) or the more packets done (patients) are kept
+asp_symmetry_program = """
+:- operator_precedes(Operator1, Operator2, CareUnit),
+    #sum { ServiceDuration,Patient,Service,Operator1 : do(Patient, Service, Operator1, CareUnit, _), service(Service, _, ServiceDuration) ;
+        -ServiceDuration,Patient,Service,Operator2 : do(Patient, Service, Operator2, CareUnit, _), service(Service, _, ServiceDuration) } < 0.
+
+:- patient_precedes(Patient1, Patient2),
+    #sum { 1,Packet : packet_done(Patient1, Packet) ; -1,Packet : packet_done(Patient2, Packet) } < 0.
+"""
+
+# consecutive pairs of interchangeable operators (same care unit, start and duration) as (care unit, operator1, operator2),
+# and of interchangeable patients (same packets and priority) as (patient1, patient2). Swapping the whole schedules
+# of two such operators or patients gives a solution with the same value
+def get_day_symmetries(day_name, operators, priorities, requests):
+    operator_groups = dict()
+    for care_unit_name, care_unit in operators[day_name].items():
+        for operator_name, operator in care_unit.items():
+            key = (care_unit_name, operator["start"], operator["duration"])
+            if key not in operator_groups:
+                operator_groups[key] = []
+            operator_groups[key].append(operator_name)
+    operator_pairs = []
+    for (care_unit_name, _, _), operator_names in sorted(operator_groups.items()):
+        operator_names.sort()
+        for index in range(len(operator_names) - 1):
+            operator_pairs.append((care_unit_name, operator_names[index], operator_names[index + 1]))
+
+    patient_groups = dict()
+    for patient_name, patient in requests[day_name].items():
+        if len(patient["packets"]) == 0:
+            continue
+        key = (tuple(sorted(set(patient["packets"]))), priorities[patient_name])
+        if key not in patient_groups:
+            patient_groups[key] = []
+        patient_groups[key].append(patient_name)
+    patient_pairs = []
+    for _, patient_names in sorted(patient_groups.items()):
+        patient_names.sort()
+        for index in range(len(patient_names) - 1):
+            patient_pairs.append((patient_names[index], patient_names[index + 1]))
+
+    return operator_pairs, patient_pairs
+
+# the first operator (patient) of each interchangeable pair has the greater load (number of packets done).
+# assignment is the variable of the model whose indexes start with (patient, service, compound operator name)
+def add_symmetry_constraints(model, assignment, day_name, services, operators, priorities, requests):
+    operator_pairs, patient_pairs = get_day_symmetries(day_name, operators, priorities, requests)
+
+    operator_buckets = dict() # compound name -> assignment indexes of the operator
+    for index in assignment:
+        if index[2] not in operator_buckets:
+            operator_buckets[index[2]] = []
+        operator_buckets[index[2]].append(index)
+    model.operator_symmetries = Constraint(range(len(operator_pairs)))
+    for pair_index, (care_unit_name, operator_name1, operator_name2) in enumerate(operator_pairs):
+        compound_name1 = f"{operator_name1}__{care_unit_name}"
+        compound_name2 = f"{operator_name2}__{care_unit_name}"
+        if compound_name1 not in operator_buckets:
+            continue
+        model.operator_symmetries[pair_index] = (sum(services[index[1]]["duration"] * assignment[index] for index in operator_buckets[compound_name1]) >=
+            sum(services[index[1]]["duration"] * assignment[index] for index in operator_buckets[compound_name2]))
+
+    patient_buckets = dict() # patient -> packet indexes of the patient
+    for patient_name, packet_name in model.packet_indexes:
+        if patient_name not in patient_buckets:
+            patient_buckets[patient_name] = []
+        patient_buckets[patient_name].append((patient_name, packet_name))
+    model.patient_symmetries = Constraint(range(len(patient_pairs)))
+    for pair_index, (patient_name1, patient_name2) in enumerate(patient_pairs):
+        if patient_name1 not in patient_buckets:
+            continue
+        model.patient_symmetries[pair_index] = (sum(model.packet[packet_index] for packet_index in patient_buckets[patient_name1]) >=
+            sum(model.packet[packet_index] for packet_index in patient_buckets[patient_name2]))
+
+def solve_day_with_asp(day_name, services, packets, operators, priorities, requests, symmetry_breaking=False):
 
     daily_requests = requests[day_name]
 
@@ -65,72 +147,73 @@ def solve_day_with_asp(day_name, services, packets, operators, priorities, reque
     packet_names = set()
     care_unit_names = set()
 
-    with open("input.lp", "w") as f:
-        for patient_name, patient in daily_requests.items():
-            patient_names.add(patient_name)
-            for packet_name in patient['packets']:
-                packet_names.add(packet_name)
-                for service_name in packets[packet_name]:
-                    service_names.add(service_name)
-                    care_unit_names.add(services[service_name]['careUnit'])
-                f.write(f"patient_requests_packet({patient_name}, {packet_name}).\n")
+    facts = []
+    for patient_name, patient in daily_requests.items():
+        patient_names.add(patient_name)
+        for packet_name in patient['packets']:
+            packet_names.add(packet_name)
+            for service_name in packets[packet_name]:
+                service_names.add(service_name)
+                care_unit_names.add(services[service_name]['careUnit'])
+            facts.append(("patient_requests_packet", [patient_name, packet_name]))
 
     patient_names = sorted(patient_names)
     service_names = sorted(service_names)
     packet_names = sorted(packet_names)
     care_unit_names = sorted(care_unit_names)
 
-    with open("input.lp", "a") as f:
-        for patient_name in patient_names:
-            f.write(f"patient_has_priority({patient_name}, {priorities[patient_name]}).\n")
+    for patient_name in patient_names:
+        facts.append(("patient_has_priority", [patient_name, priorities[patient_name]]))
 
-    with open("input.lp", "a") as f:
-        for service_name in service_names:
-            f.write(f"service({service_name}, {services[service_name]['careUnit']}, {services[service_name]['duration']}).\n")
+    for service_name in service_names:
+        facts.append(("service", [service_name, services[service_name]['careUnit'], services[service_name]['duration']]))
 
-    with open("input.lp", "a") as f:
-        for packet_name in packet_names:
-            for service_name in packets[packet_name]:
-                f.write(f"packet_has_service({packet_name}, {service_name}).\n")
+    for packet_name in packet_names:
+        for service_name in packets[packet_name]:
+            facts.append(("packet_has_service", [packet_name, service_name]))
 
     max_time = 0
 
-    with open("input.lp", "a") as f:
-        for care_unit_name in care_unit_names:
-            for operator_name, operator in operators[day_name][care_unit_name].items():
-                if operator['start'] + operator['duration'] > max_time:
-                    max_time = operator['start'] + operator['duration']
-                f.write(f"operator({operator_name}, {care_unit_name}, {operator['start']}, {operator['duration']}).\n")
-
-    with open("input.lp", "a") as f:
-        f.write(f"time(0..{max_time - 1}).\n")
-    
-    with open("program.lp", "w") as f:
-        f.write(asp_program)
+    for care_unit_name in care_unit_names:
+        for operator_name, operator in operators[day_name][care_unit_name].items():
+            if operator['start'] + operator['duration'] > max_time:
+                max_time = operator['start'] + operator['duration']
+            facts.append(("operator", [operator_name, care_unit_name, operator['start'], operator['duration']]))
+
+    for time in range(max_time):
+        facts.append(("time", [time]))
+
+    program = asp_program
+    if symmetry_breaking:
+        operator_pairs, patient_pairs = get_day_symmetries(day_name, operators, priorities, requests)
+        for care_unit_name, operator_name1, operator_name2 in operator_pairs:
+            if care_unit_name in care_unit_names:
+                facts.append(("operator_precedes", [operator_name1, operator_name2, care_unit_name]))
+        for patient_name1, patient_name2 in patient_pairs:
+            facts.append(("patient_precedes", [patient_name1, patient_name2]))
+        program += asp_symmetry_program
 
     # solve subproblem problem
-    with open("output.txt", "w") as f:
-        subprocess.run(["clingo", "input.lp", "program.lp"], stdout=f, stderr=subprocess.DEVNULL)
+    atoms = solve_asp_program(program, facts)
 
     # decoding solver answer
     daily_scheduled_services = []
-    with open("output.txt", "r") as f:
-        rows = f.read().split("Answer")[-1].split("\n")[1].split("do(")[1:]
-        if len(rows) > 0:
-            rows[-1] += " "
-            for row in rows:
-                tokens = row.split(",")
-                tokens[4] = tokens[4][:-2]
-                daily_scheduled_services.append({
-                    'patient': tokens[0],
-                    'service': tokens[1],
-                    'operator': tokens[2],
-                    'care_unit': tokens[3],
-                    'start': int(tokens[4])
-                })
+    if atoms is None:
+        return daily_scheduled_services
+    for _, (patient_name, service_name, operator_name, care_unit_name, start) in atoms:
+        daily_scheduled_services.append({
+            'patient': patient_name,
+            'service': service_name,
+            'operator': operator_name,
+            'care_unit': care_unit_name,
+            'start': start
+        })
     return daily_scheduled_services
 
-def solve_day_with_milp(day_name, services, packets, operators, priorities, requests, method):
+# The solver settings come from get_solver_settings (gurobi with its defaults if None); if an outcome dict is given,
+# it is filled with the status, incumbent and bound of the solve
+def solve_day_with_milp(day_name, services, packets, operators, priorities, requests, method, warm_start=None, symmetry_breaking=False,
+        solver=None, outcome=None):
 
     # accumulators for each necessary index (no useless info)
     x_indexes = set()
@@ -240,8 +323,15 @@ def solve_day_with_milp(day_name, services, packets, operators, priorities, requ
         return model.t[patient_name, service_name] >= model.x[patient_name, service_name]
     model.x_and_t = Constraint(model.x_indexes, rule=f2)
 
+    # (patient, service) -> chi indexes of the operators that could satisfy the service
+    chi_buckets = dict()
+    for patient_name, service_name, compound_name in model.chi_indexes:
+        if (patient_name, service_name) not in chi_buckets:
+            chi_buckets[patient_name, service_name] = []
+        chi_buckets[patient_name, service_name].append(compound_name)
+
     def f3(model, patient_name, service_name):
-        return sum(model.chi[p, s, o] for p, s, o in model.chi_indexes if patient_name == p and service_name == s) == model.x[patient_name, service_name]
+        return sum(model.chi[patient_name, service_name, o] for o in chi_buckets[patient_name, service_name]) == model.x[patient_name, service_name]
     model.x_and_chi = Constraint(model.x_indexes, rule=f3)
 
     def f4(model, patient_name, service_name, compound_name):
@@ -302,7 +392,7 @@ def solve_day_with_milp(day_name, services, packets, operators, priorities, requ
             service_duration = services[service_name2]["duration"]
             _, care_unit_name = operator_name.split("__")
             return (model.t[patient_name2, service_name2] + service_duration * model.chi[patient_name2, service_name2, operator_name] <= model.t[patient_name1, service_name1] +
-                model.aux2[operator_name, patient_name1, service_name1, patient_name2, service_name2, 1] * max_times[care_unit_name])
+                (1 - model.aux2[operator_name, patient_name1, service_name1, patient_name2, service_name2, 1]) * max_times[care_unit_name])
         model.operator_not_overlaps2 = Constraint(model.aux2_indexes, rule=f10)
 
         def f11(model, operator_name, patient_name1, service_name1, patient_name2, service_name2, n):
@@ -361,140 +451,482 @@ def solve_day_with_milp(day_name, services, packets, operators, priorities, requ
             return model.epsilon2[operator_name, patient_name1, service_name1, patient_name2, service_name2] <= model.x[patient_name1, service_name1]
         model.ff6 = Constraint(model.aux2_indexes, rule=f16)
 
+    if symmetry_breaking:
+        add_symmetry_constraints(model, model.chi, day_name, services, operators, priorities, requests)
+
     # if day_name == "day27":
     #     model.pprint()
 
-    opt = SolverFactory("gurobi")
-    result = opt.solve(model)
-
-    # decoding solver answer
-    if result.solver.termination_condition == TerminationCondition.infeasible:
+    # the solver completes the pairwise variables of a partial start
+    if warm_start is not None:
+        started_services = {(s["patient"], s["service"]): s for s in warm_start}
+        for patient_name, service_name in model.x_indexes:
+            started_service = started_services.get((patient_name, service_name))
+            model.x[patient_name, service_name].set_value(int(started_service is not None))
+            model.t[patient_name, service_name].set_value(started_service["start"] if started_service is not None else 0)
+        for patient_name, service_name, compound_name in model.chi_indexes:
+            started_service = started_services.get((patient_name, service_name))
+            model.chi[patient_name, service_name, compound_name].set_value(int(started_service is not None and
+                compound_name == f"{started_service['operator']}__{started_service['care_unit']}"))
+        for patient_name, packet_name in model.packet_indexes:
+            model.packet[patient_name, packet_name].set_value(int(all((patient_name, service_name) in started_services for service_name in packets[packet_name])))
+
+    solve_outcome = solve_model(model, solver if solver is not None else get_solver_settings(), warm_start is not None)
+    if outcome is not None:
+        outcome.update(solve_outcome)
+
+    # decoding solver answer (the best one found if a limit stopped the search)
+    if not solve_outcome["hasSolution"]:
         return []
 
     daily_scheduled_services = []
     for patient_name, service_name, compound_name in model.chi_indexes:
-        if value(model.chi[patient_name, service_name, compound_name]):
+        if value(model.chi[patient_name, service_name, compound_name]) > 0.5:
             operator_name, care_unit_name = compound_name.split("__")
             daily_scheduled_services.append({
                 "patient": patient_name,
                 "service": service_name,
                 "operator": operator_name,
                 "care_unit": care_unit_name,
-                "start": int(value(model.t[patient_name, service_name]))
+                "start": int(round(value(model.t[patient_name, service_name])))
             })
     return daily_scheduled_services
 
-def solve_subproblem(services, packets, operators, priorities, requests, method, verbose):
-    results = dict()
-    for day_name in requests.keys():
+# time-indexed MILP: a binary y for every feasible (patient, service, operator, start) and, for each time slot,
+# at most one service covering it per operator and per patient. No big-M and no pairwise variables are needed.
+# Solver settings and outcome as in solve_day_with_milp
+def solve_day_with_timeindexed_milp(day_name, services, packets, operators, priorities, requests, warm_start=None, symmetry_breaking=False,
+        solver=None, outcome=None):
 
-        if verbose and method != "asp":
-            print(f"{day_name}", end=", ")
+    daily_requests = requests[day_name]
 
-        if method == "asp":
-            daily_scheduled_services = solve_day_with_asp(day_name, services, packets, operators, priorities, requests)
-        else:
-            daily_scheduled_services = solve_day_with_milp(day_name, services, packets, operators, priorities, requests, method)
-        
-        # list all not satisfied packets
-        not_scheduled_packets = dict()
-        for patient_name, patient in requests[day_name].items():
-            for packet_name in patient["packets"]:
-                is_packet_satisfied = True
+    if len(daily_requests) == 0:
+        return []
+
+    # accumulators for each necessary index (no useless info)
+    x_indexes = set()
+    y_indexes = set()
+    packet_indexes = set()
+    packet_consistency_indexes = set()
+
+    for patient_name, patient in daily_requests.items():
+        for packet_name in patient["packets"]:
+            is_packet_satisfiable = True
+            temp_x_indexes = set()
+            temp_y_indexes = set()
+            for service_name in packets[packet_name]:
+                care_unit_name = services[service_name]["careUnit"]
+                service_duration = services[service_name]["duration"]
+                temp_y_number = len(temp_y_indexes)
+                for operator_name, operator in operators[day_name][care_unit_name].items():
+                    for time in range(operator["start"], operator["start"] + operator["duration"] - service_duration + 1):
+                        temp_y_indexes.add((patient_name, service_name, f"{operator_name}__{care_unit_name}", time))
+                if len(temp_y_indexes) == temp_y_number:
+                    is_packet_satisfiable = False
+                    break
+                temp_x_indexes.add((patient_name, service_name))
+            if is_packet_satisfiable:
+                x_indexes.update(temp_x_indexes)
+                y_indexes.update(temp_y_indexes)
+                packet_indexes.add((patient_name, packet_name))
                 for service_name in packets[packet_name]:
-                    is_service_done = False
-                    for scheduled_service in daily_scheduled_services:
-                        if scheduled_service["patient"] == patient_name and scheduled_service["service"] == service_name:
-                            is_service_done = True
-                            break
-                    if not is_service_done:
-                        is_packet_satisfied = False
-                        break
-                if not is_packet_satisfied:
-                    if patient_name not in not_scheduled_packets:
-                        not_scheduled_packets[patient_name] = []
-                    not_scheduled_packets[patient_name].append(packet_name)
-            if patient_name in not_scheduled_packets:
-                not_scheduled_packets[patient_name].sort()
-        
-        # list all unused operators
-        unused_operators = dict()
-        for care_unit_name, care_unit in operators[day_name].items():
-            for operator_name in care_unit.keys():
-                is_operator_used = False
-                for scheduled_service in daily_scheduled_services:
-                    if scheduled_service["care_unit"] == care_unit_name and scheduled_service["operator"] == operator_name:
-                        is_operator_used = True
-                        break
-                if not is_operator_used:
-                    if care_unit_name not in unused_operators:
-                        unused_operators[care_unit_name] = []
-                    unused_operators[care_unit_name].append(operator_name)
-
-        results[day_name] = {
-            "scheduledServices": sorted(daily_scheduled_services, key=lambda r: r["patient"] + r["service"]),
-            "notScheduledPackets": not_scheduled_packets,
-            "unusedOperators": unused_operators
-        }
-    
-    # removing of temporary files
-    if os.path.isfile("input.lp"):
-        os.remove("input.lp")
-    if os.path.isfile("program.lp"):
-        os.remove("program.lp")
-    if os.path.isfile("output.txt"):
-        os.remove("output.txt")
+                    packet_consistency_indexes.add((patient_name, packet_name, service_name))
+
+    if len(packet_indexes) == 0:
+        return []
+
+    # (patient, service) -> its y indexes, and the y indexes covering each time slot of an operator or a patient
+    x_buckets = dict()
+    operator_slots = dict()
+    patient_slots = dict()
+    for patient_name, service_name, compound_name, time in y_indexes:
+        index = (patient_name, service_name, compound_name, time)
+        if (patient_name, service_name) not in x_buckets:
+            x_buckets[patient_name, service_name] = []
+        x_buckets[patient_name, service_name].append(index)
+        for slot in range(time, time + services[service_name]["duration"]):
+            if (compound_name, slot) not in operator_slots:
+                operator_slots[compound_name, slot] = []
+            operator_slots[compound_name, slot].append(index)
+            if (patient_name, slot) not in patient_slots:
+                patient_slots[patient_name, slot] = []
+            patient_slots[patient_name, slot].append(index)
+
+    # a slot used by a single service cannot be overbooked
+    operator_slot_indexes = sorted(slot_index for slot_index, indexes in operator_slots.items() if len(indexes) > 1)
+    patient_slot_indexes = sorted(slot_index for slot_index, indexes in patient_slots.items() if len(indexes) > 1)
 
-    return results
+    model = ConcreteModel()
+
+    model.x_indexes = Set(initialize=sorted(x_indexes))
+    model.y_indexes = Set(initialize=sorted(y_indexes))
+    model.packet_indexes = Set(initialize=sorted(packet_indexes))
+    model.packet_consistency_indexes = Set(initialize=sorted(packet_consistency_indexes))
+    model.operator_slot_indexes = Set(initialize=operator_slot_indexes)
+    model.patient_slot_indexes = Set(initialize=patient_slot_indexes)
+
+    del x_indexes, y_indexes, packet_indexes, packet_consistency_indexes, operator_slot_indexes, patient_slot_indexes
+
+    model.x = Var(model.x_indexes, domain=Boolean)
+    model.y = Var(model.y_indexes, domain=Boolean)
+    model.packet = Var(model.packet_indexes, domain=Boolean)
+
+    def f(model):
+        return sum(model.packet[patient_name, packet_name] * priorities[patient_name] for patient_name, packet_name in model.packet_indexes)
+    model.objective = Objective(rule=f, sense=maximize)
+
+    def f1(model, patient_name, service_name):
+        return sum(model.y[index] for index in x_buckets[patient_name, service_name]) == model.x[patient_name, service_name]
+    model.x_and_y = Constraint(model.x_indexes, rule=f1)
+
+    def f2(model, patient_name, packet_name, service_name):
+        return model.packet[patient_name, packet_name] <= model.x[patient_name, service_name]
+    model.packet_consistency = Constraint(model.packet_consistency_indexes, rule=f2)
+
+    def f3(model, compound_name, slot):
+        return sum(model.y[index] for index in operator_slots[compound_name, slot]) <= 1
+    model.operator_not_overlaps = Constraint(model.operator_slot_indexes, rule=f3)
+
+    def f4(model, patient_name, slot):
+        return sum(model.y[index] for index in patient_slots[patient_name, slot]) <= 1
+    model.patient_not_overlaps = Constraint(model.patient_slot_indexes, rule=f4)
+
+    # (patient, service) -> the packets containing it
+    packet_buckets = dict()
+    for patient_name, packet_name, service_name in model.packet_consistency_indexes:
+        if (patient_name, service_name) not in packet_buckets:
+            packet_buckets[patient_name, service_name] = []
+        packet_buckets[patient_name, service_name].append(packet_name)
+
+    # a service is done only as part of a completed packet
+    def f5(model, patient_name, service_name):
+        return model.x[patient_name, service_name] <= sum(model.packet[patient_name, packet_name] for packet_name in packet_buckets[patient_name, service_name])
+    model.x_and_packets = Constraint(model.x_indexes, rule=f5)
+
+    if symmetry_breaking:
+        add_symmetry_constraints(model, model.y, day_name, services, operators, priorities, requests)
+
+    if warm_start is not None:
+        started_indexes = set((s["patient"], s["service"], f"{s['operator']}__{s['care_unit']}", s["start"]) for s in warm_start)
+        started_services = set((patient_name, service_name) for patient_name, service_name, _, _ in started_indexes)
+        for index in model.y_indexes:
+            model.y[index].set_value(int(index in started_indexes))
+        for patient_name, service_name in model.x_indexes:
+            model.x[patient_name, service_name].set_value(int((patient_name, service_name) in started_services))
+        for patient_name, packet_name in model.packet_indexes:
+            model.packet[patient_name, packet_name].set_value(int(all((patient_name, service_name) in started_services for service_name in packets[packet_name])))
+
+    solve_outcome = solve_model(model, solver if solver is not None else get_solver_settings(), warm_start is not None)
+    if outcome is not None:
+        outcome.update(solve_outcome)
+
+    # decoding solver answer (the best one found if a limit stopped the search)
+    if not solve_outcome["hasSolution"]:
+        return []
+
+    daily_scheduled_services = []
+    for patient_name, service_name, compound_name, time in model.y_indexes:
+        if value(model.y[patient_name, service_name, compound_name, time]) > 0.5:
+            operator_name, care_unit_name = compound_name.split("__")
+            daily_scheduled_services.append({
+                "patient": patient_name,
+                "service": service_name,
+                "operator": operator_name,
+                "care_unit": care_unit_name,
+                "start": time
+            })
+    return daily_scheduled_services
+
+# earliest start of a service long as duration inside [window_start, window_end) avoiding all the busy intervals (None if there is none)
+def get_earliest_start(busy_intervals, window_start, window_end, duration):
+    start = window_start
+    for busy_start, busy_end in sorted(busy_intervals):
+        if busy_end <= start:
+            continue
+        if start + duration <= busy_start:
+            break
+        start = busy_end
+    if start + duration > window_end:
+        return None
+    return start
+
+# greedy list scheduling: packets by decreasing priority (shorter ones first), each missing service (longest first)
+# at the earliest start free for both the patient and some operator of its care unit.
+# A packet is kept only if all its services fit, otherwise its tentative services are dropped.
+# No service starts at 0, as in the MILP (t >= x), so that the schedule is a feasible warm start for it
+def solve_day_with_heuristic(day_name, services, packets, operators, priorities, requests):
+
+    daily_requests = requests[day_name]
+
+    operator_intervals = dict() # (care unit, operator) -> busy intervals
+    patient_intervals = dict() # patient -> busy intervals
+    done_services = set() # (patient, service)
+    daily_scheduled_services = []
+
+    packet_indexes = [(patient_name, packet_name) for patient_name, patient in daily_requests.items() for packet_name in patient["packets"]]
+    packet_indexes.sort(key=lambda packet_index: (-priorities[packet_index[0]],
+        sum(services[service_name]["duration"] for service_name in packets[packet_index[1]]), packet_index))
+
+    for patient_name, packet_name in packet_indexes:
+        service_names = sorted(set(service_name for service_name in packets[packet_name] if (patient_name, service_name) not in done_services),
+            key=lambda service_name: (-services[service_name]["duration"], service_name))
+        new_services = []
+        for service_name in service_names:
+            care_unit_name = services[service_name]["careUnit"]
+            service_duration = services[service_name]["duration"]
+            busy_patient_intervals = patient_intervals.get(patient_name, []) + [(s["start"], s["start"] + services[s["service"]]["duration"]) for s in new_services]
+            best_start = None
+            for operator_name, operator in operators[day_name].get(care_unit_name, dict()).items():
+                busy_intervals = operator_intervals.get((care_unit_name, operator_name), []) + busy_patient_intervals + [(s["start"], s["start"] + services[s["service"]]["duration"])
+                    for s in new_services if s["care_unit"] == care_unit_name and s["operator"] == operator_name]
+                start = get_earliest_start(busy_intervals, max(operator["start"], 1), operator["start"] + operator["duration"], service_duration)
+                if start is not None and (best_start is None or start < best_start):
+                    best_start = start
+                    best_operator_name = operator_name
+            if best_start is None:
+                new_services = None
+                break
+            new_services.append({
+                "patient": patient_name,
+                "service": service_name,
+                "operator": best_operator_name,
+                "care_unit": care_unit_name,
+                "start": best_start
+            })
+        if new_services is None:
+            continue
+        for scheduled_service in new_services:
+            interval = (scheduled_service["start"], scheduled_service["start"] + services[scheduled_service["service"]]["duration"])
+            operator_key = (scheduled_service["care_unit"], scheduled_service["operator"])
+            if operator_key not in operator_intervals:
+                operator_intervals[operator_key] = []
+            operator_intervals[operator_key].append(interval)
+            if patient_name not in patient_intervals:
+                patient_intervals[patient_name] = []
+            patient_intervals[patient_name].append(interval)
+            done_services.add((patient_name, scheduled_service["service"]))
+        daily_scheduled_services.extend(new_services)
+
+    return daily_scheduled_services
+
+# the scheduled services that complete some requested packet of their patient. The big-M MILPs can keep
+# services of incomplete packets, since they do not change the objective
+def remove_stray_services(day_name, packets, requests, daily_scheduled_services):
+    done_services = set((scheduled_service["patient"], scheduled_service["service"]) for scheduled_service in daily_scheduled_services)
+    packet_services = set()
+    for patient_name, patient in requests[day_name].items():
+        for packet_name in patient["packets"]:
+            if all((patient_name, service_name) in done_services for service_name in packets[packet_name]):
+                packet_services.update((patient_name, service_name) for service_name in packets[packet_name])
+    return [scheduled_service for scheduled_service in daily_scheduled_services if (scheduled_service["patient"], scheduled_service["service"]) in packet_services]
+
+# schedule the services of a single day. With the heuristic prepass, the exact method is skipped
+# if the heuristic schedules every requested packet; otherwise the MILP methods start from its schedule.
+# Returns the scheduled services (only the ones of completed packets) and the outcome of the MILP solve (None if no solver was called)
+def schedule_day(day_name, services, packets, operators, priorities, requests, method, heuristic_prepass=False, symmetry_breaking=False, solver=None):
+    warm_start = None
+    if method == "heuristic" or heuristic_prepass:
+        heuristic_scheduled_services = solve_day_with_heuristic(day_name, services, packets, operators, priorities, requests)
+        not_scheduled_packets, _ = analyze_day(day_name, packets, operators, requests, heuristic_scheduled_services)
+        if method == "heuristic" or len(not_scheduled_packets) == 0:
+            return heuristic_scheduled_services, None
+        warm_start = heuristic_scheduled_services
+
+    if method == "asp":
+        return solve_day_with_asp(day_name, services, packets, operators, priorities, requests, symmetry_breaking), None
+    outcome = dict()
+    if method == "milp_timeindexed":
+        daily_scheduled_services = solve_day_with_timeindexed_milp(day_name, services, packets, operators, priorities, requests, warm_start, symmetry_breaking, solver, outcome)
+    else:
+        daily_scheduled_services = solve_day_with_milp(day_name, services, packets, operators, priorities, requests, method, warm_start, symmetry_breaking, solver, outcome)
+    daily_scheduled_services = remove_stray_services(day_name, packets, requests, daily_scheduled_services)
+    return daily_scheduled_services, (outcome if len(outcome) > 0 else None)
+
+# entry of the results of a day from its scheduled services. The outcomes of the solves stopped before optimality
+# (by a time limit) are kept in solverOutcomes
+def get_daily_results(day_name, packets, operators, requests, daily_scheduled_services, outcomes=()):
+    not_scheduled_packets, unused_operators = analyze_day(day_name, packets, operators, requests, daily_scheduled_services)
+
+    daily_results = {
+        "scheduledServices": sorted(daily_scheduled_services, key=lambda r: r["patient"] + r["service"]),
+        "notScheduledPackets": not_scheduled_packets,
+        "unusedOperators": unused_operators
+    }
+    not_optimal_outcomes = [outcome for outcome in outcomes if outcome is not None and outcome["status"] != "optimal"]
+    if len(not_optimal_outcomes) > 0:
+        daily_results["solverOutcomes"] = not_optimal_outcomes
+    return daily_results
+
+# solve a single day, returning its entry of the results
+def solve_day(day_name, services, packets, operators, priorities, requests, method, heuristic_prepass=False, symmetry_breaking=False, solver=None):
+    daily_scheduled_services, outcome = schedule_day(day_name, services, packets, operators, priorities, requests, method, heuristic_prepass, symmetry_breaking, solver)
+    return get_daily_results(day_name, packets, operators, requests, daily_scheduled_services, [outcome])
+
+# patients interact only through the care units of their packets, and each patient links all its care units together.
+# Returns the independent parts of a day as (operators, requests) pairs restricted to a group of linked care units
+def get_day_components(day_name, services, packets, operators, requests):
+    parents = dict() # care unit -> parent care unit
+    patient_care_units = dict() # patient -> a care unit of its packets
+    for patient_name, patient in requests[day_name].items():
+        for packet_name in patient["packets"]:
+            for service_name in packets[packet_name]:
+                care_unit_name = services[service_name]["careUnit"]
+                if care_unit_name not in parents:
+                    parents[care_unit_name] = care_unit_name
+                if patient_name in patient_care_units:
+                    join_roots(parents, patient_care_units[patient_name], care_unit_name)
+                else:
+                    patient_care_units[patient_name] = care_unit_name
+
+    component_operators = dict() # root care unit -> operators of the component
+    for care_unit_name in sorted(parents.keys()):
+        root = find_root(parents, care_unit_name)
+        if root not in component_operators:
+            component_operators[root] = dict()
+        component_operators[root][care_unit_name] = operators[day_name].get(care_unit_name, dict())
+
+    component_requests = dict() # root care unit -> requests of the component
+    for patient_name, care_unit_name in patient_care_units.items():
+        root = find_root(parents, care_unit_name)
+        if root not in component_requests:
+            component_requests[root] = dict()
+        component_requests[root][patient_name] = requests[day_name][patient_name]
+
+    return [(component_operators[root], component_requests[root]) for root in sorted(component_requests.keys())]
+
+# days are independent, so with more than one worker they are solved concurrently in separate processes.
+# With decompose, each day is further split in its independent components, solved separately and merged.
+# If a cache is given, days already solved with the same inputs are taken from it instead of being solved again.
+# The MILP methods use the solver settings of get_solver_settings (gurobi with its defaults if None)
+def solve_subproblem(services, packets, operators, priorities, requests, method, verbose, workers=1, cache=None, heuristic_prepass=False, decompose=False, symmetry_breaking=False,
+        solver=None):
+    results = dict()
+
+    # the prepass and the symmetry breaking can return a different (but equally good) schedule, so they get their own cache entries
+    cache_method = method
+    if heuristic_prepass and method != "heuristic":
+        cache_method += "+heuristic"
+    if symmetry_breaking and method != "heuristic":
+        cache_method += "+symmetry"
+    # different solvers can return different optimal schedules, and limited solves can return worse ones
+    if method.startswith("milp"):
+        if solver is None:
+            solver = get_solver_settings()
+        cache_method += f"+{solver['solver']}"
+        if solver["timeLimit"] is not None or solver["gap"] is not None:
+            cache_method += f"+limit{solver['timeLimit']}+gap{solver['gap']}"
+
+    day_keys = dict()
+    day_names_to_solve = []
+    for day_name in requests.keys():
+        if cache is not None:
+            day_keys[day_name] = get_day_key(day_name, services, packets, operators, priorities, requests, cache_method)
+            daily_results = get_cached_day(cache, day_keys[day_name])
+            if daily_results is not None:
+                results[day_name] = daily_results
+                continue
+        day_names_to_solve.append(day_name)
+
+    # day -> list of (operators, requests) of the day, each with only the data of its day
+    day_tasks = dict()
+    for day_name in day_names_to_solve:
+        if decompose:
+            day_tasks[day_name] = [({ day_name: component_operators }, { day_name: component_requests })
+                for component_operators, component_requests in get_day_components(day_name, services, packets, operators, requests)]
+        else:
+            day_tasks[day_name] = [({ day_name: operators[day_name] }, { day_name: requests[day_name] })]
+
+    if workers <= 1:
+        for day_name in day_names_to_solve:
+            if verbose and method != "asp":
+                print(f"{day_name}", end=", ")
+            daily_scheduled_services = []
+            outcomes = []
+            for task_operators, task_requests in day_tasks[day_name]:
+                task_scheduled_services, outcome = schedule_day(day_name, services, packets, task_operators, priorities, task_requests, method, heuristic_prepass, symmetry_breaking, solver)
+                daily_scheduled_services.extend(task_scheduled_services)
+                outcomes.append(outcome)
+            results[day_name] = get_daily_results(day_name, packets, operators, requests, daily_scheduled_services, outcomes)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = dict()
+            for day_name in day_names_to_solve:
+                futures[day_name] = [executor.submit(schedule_day, day_name, services, packets, task_operators, priorities, task_requests, method, heuristic_prepass, symmetry_breaking, solver)
+                    for task_operators, task_requests in day_tasks[day_name]]
+            for day_name in day_names_to_solve: # merge in the requests order, independently of completion order
+                daily_scheduled_services = []
+                outcomes = []
+                for future in futures[day_name]:
+                    task_scheduled_services, outcome = future.result()
+                    daily_scheduled_services.extend(task_scheduled_services)
+                    outcomes.append(outcome)
+                results[day_name] = get_daily_results(day_name, packets, operators, requests, daily_scheduled_services, outcomes)
+                if verbose and method != "asp":
+                    print(f"{day_name}", end=", ")
+
+    if cache is not None:
+        for day_name in day_names_to_solve:
+            put_cached_day(cache, day_keys[day_name], results[day_name])
+
+    return {day_name: results[day_name] for day_name in requests.keys()}
+
+def process_instance(instance_path, args):
+    with open(os.path.join(instance_path, "services.json"), "r") as f:
+        services = json.load(f)
+    with open(os.path.join(instance_path, "packets.json"), "r") as f:
+        packets = json.load(f)
+    with open(os.path.join(instance_path, "operators.json"), "r") as f:
+        operators = json.load(f)
+    with open(os.path.join(instance_path, "priorities.json"), "r") as f:
+        priorities = json.load(f)
+    with open(os.path.join(instance_path, "requests.json"), "r") as f:
+        requests = json.load(f)
+    cache = None
+    if args.cache:
+        cache = load_cache(os.path.join(instance_path, "subproblem_cache.json"), args.cache_size)
+    start_time = datetime.now()
+    solver = get_solver_settings(args.solver, args.solver_time_limit, args.mip_gap, args.threads)
+    results = solve_subproblem(services, packets, operators, priorities, requests, args.method, args.verbose and args.jobs <= 1, args.workers, cache, args.heuristic_prepass, args.decompose, args.symmetry_breaking,
+        solver)
+    end_time = datetime.now()
+    with open(os.path.join(instance_path, "results.json"), "w") as f:
+        json.dump(results, f, indent=4)
+    if args.cache:
+        save_cache(cache, os.path.join(instance_path, "subproblem_cache.json"))
+        if args.verbose and args.jobs <= 1:
+            print(f"(cache hits: {cache['hits']}, misses: {cache['misses']})", end=" ")
+    return (end_time - start_time).total_seconds()
 
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description="Solve subproblem instances")
-    parser.add_argument("-m", "--method", metavar="MET", type=str, default="asp", choices=["asp", "milp_basic", "milp_optimized", "milp_epsilon"], help="solution method used (asp|milp_basic|milp_optimized|milp_epsilon)")
+    parser.add_argument("-m", "--method", metavar="MET", type=str, default="asp", choices=["asp", "milp_basic", "milp_optimized", "milp_epsilon", "milp_timeindexed", "heuristic"], help="solution method used (asp|milp_basic|milp_optimized|milp_epsilon|milp_timeindexed|heuristic)")
+    parser.add_argument("--heuristic-prepass", action="store_true", help="try the heuristic first, solving only the days it does not fully schedule (MILP methods start from its schedule)")
     parser.add_argument("-i", "--input", metavar="IN", type=str, default="instances", help="input folder with the instances")
+    parser.add_argument("--symmetry-breaking", action="store_true", help="exclude the solutions equal to another one up to identical operators or patients")
+    parser.add_argument("--decompose", action="store_true", help="solve separately the groups of care units of each day not linked by any patient")
+    parser.add_argument("-s", "--solver", metavar="SOL", type=str, default="gurobi", choices=list(solver_backends.keys()), help="solver used by the MILP methods (gurobi|highs|cbc)")
+    parser.add_argument("--solver-time-limit", metavar="SEC", type=float, default=None, help="stop the MILP solve of each day after these many seconds, keeping the best schedule found")
+    parser.add_argument("--mip-gap", metavar="GAP", type=float, default=None, help="relative gap at which the MILP solves stop")
+    parser.add_argument("--threads", metavar="NUM", type=int, default=None, help="threads used by the MILP solver")
+    parser.add_argument("-w", "--workers", metavar="NUM", type=int, default=1, help="number of days solved in parallel")
+    parser.add_argument("-j", "--jobs", metavar="NUM", type=int, default=1, help="number of instances processed in parallel")
+    parser.add_argument("--cache", action="store_true", help="reuse the daily results saved in each instance cache")
+    parser.add_argument("--cache-size", metavar="NUM", type=int, default=10000, help="maximum number of days kept in the cache")
     parser.add_argument("-v", "--verbose", action="store_true", help="show what is done")
     args = parser.parse_args(sys.argv[1:])
 
-    os.chdir(os.path.dirname(os.path.abspath(sys.argv[0])))
+    if args.jobs > 1 and args.workers > 1:
+        parser.error("instance jobs and day workers cannot be both greater than 1")
 
-    if not os.path.isdir(args.input):
-        raise FileNotFoundError(f"Input folder '{args.input}' not found")
-    os.chdir(args.input)
+    instance_paths = get_instance_paths(get_folder_path(sys.argv[0], args.input))
 
-    instance_number = len(os.listdir("."))
+    instance_number = len(instance_paths)
     if instance_number == 0:
         print("No instance folder found. No action taken.")
         exit(0)
 
-    if args.verbose:
-        total_time = 0
-
-    for folder_name in sorted(os.listdir(".")):
-        os.chdir(folder_name)
-        if args.verbose:
-            print(f"Read instance '{folder_name}' ... ", end=" ")
-        with open("services.json", "r") as f:
-            services = json.load(f)
-        with open("packets.json", "r") as f:
-            packets = json.load(f)
-        with open("operators.json", "r") as f:
-            operators = json.load(f)
-        with open("priorities.json", "r") as f:
-            priorities = json.load(f)
-        with open("requests.json", "r") as f:
-            requests = json.load(f)
-        if args.verbose:
-            start_time = datetime.now()
-        results = solve_subproblem(services, packets, operators, priorities, requests, args.method, args.verbose)
-        if args.verbose:
-            end_time = datetime.now()
-        with open("results.json", "w") as f:
-            json.dump(results, f, indent=4)
-        if args.verbose:
-            delta = (end_time - start_time).total_seconds()
-            print(f"finished! Time taken: {delta}s")
-            total_time += delta
-        os.chdir("..")
+    total_time = run_on_instances(process_instance, instance_paths, args)
 
     if args.verbose:
-        print(f"Solved subproblem for {instance_number} instance(s). Total time taken: {total_time}s, average: {total_time / instance_number}s")
\ No newline at end of file
+        print(f"Solved subproblem for {instance_number} instance(s). Total time taken: {total_time}s, average: {total_time / instance_number}s")
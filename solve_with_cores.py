@@ -0,0 +1,211 @@
+import os
+import sys
+import json
+import argparse
+from datetime import datetime
+
+from pyomo.environ import value
+
+from candidate_days import get_candidate_days
+from solvers import solver_backends, get_solver_settings, get_outcome_report
+from solve_master import build_master_with_milp, get_presolve_report, get_core_cuts, add_core_cut, remove_core_cut_constraints, create_persistent_master_solver, solve_persistent_master
+from solve_subproblems import solve_subproblem
+from compute_subsumptions import compute_subsumptions
+from compute_cores import compute_cores, filter_cores
+from instance_runner import get_folder_path, get_instance_paths, run_on_instances
+from subproblem_cache import load_cache, save_cache
+from core_pool import create_core_pool, save_core_pool, add_pool_cut, update_core_pool, evict_pool_cuts
+
+# number of requested and scheduled packets of a subproblem solution
+def count_packets(requests, results):
+    requested_packets = 0
+    not_scheduled_packets = 0
+    for day_name, daily_requests in requests.items():
+        for patient in daily_requests.values():
+            requested_packets += len(patient["packets"])
+        for packet_list in results[day_name]["notScheduledPackets"].values():
+            not_scheduled_packets += len(packet_list)
+    return requested_packets, requested_packets - not_scheduled_packets
+
+# logic-based Benders loop: master -> subproblems -> cores -> master with the new cuts, all in memory.
+# The master model is kept alive in a persistent solver and only receives the new cuts at each iteration.
+# Stops when no new core (or no new cut) is found, or when the iteration or time budget runs out.
+def solve_with_cores(full_input, services, packets, operators, priorities, subsumptions, args, print_flag=False, cache=None, candidate_days=None):
+    start_time = datetime.now()
+
+    model = build_master_with_milp(full_input, candidate_days)
+    if print_flag:
+        print(f"\n    {get_presolve_report(model)}", end="")
+    master_solver = get_solver_settings(args.solver, args.master_time_limit, args.mip_gap, args.threads)
+    subproblem_solver = get_solver_settings(args.subproblem_solver, args.subproblem_time_limit, args.mip_gap, args.threads)
+    opt = create_persistent_master_solver(model, master_solver)
+    new_constraints = []
+    pool = create_core_pool()
+    pool_constraints = dict() # cut key -> its constraints in the model
+    iterations = []
+    if cache is None: # days repeat a lot between iterations, so an in-memory cache is always used
+        cache = load_cache(None, args.cache_size)
+    requests = dict()
+    results = dict()
+
+    while True:
+        iteration_start_time = datetime.now()
+        hits, misses = cache["hits"], cache["misses"]
+        master_outcome = dict()
+        master_requests = solve_persistent_master(model, opt, master_solver, new_constraints, master_outcome)
+        if not master_outcome["hasSolution"]:
+            # infeasible, or stopped by --master-time-limit before any incumbent: the requests and results of the previous iteration are kept
+            iterations.append({
+                "masterObjective": None,
+                "masterStatus": master_outcome["status"],
+                "masterBound": master_outcome["bound"],
+                "masterTime": (datetime.now() - iteration_start_time).total_seconds()
+            })
+            if print_flag:
+                print(f"\n    iteration {len(iterations)}: no master solution ({get_outcome_report(master_outcome)}), stopping", end="")
+            break
+        binding_cut_number = update_core_pool(pool, model)
+        evicted_keys = evict_pool_cuts(pool, args.pool_max_idle, args.pool_max_size)
+        for key in evicted_keys: # the next solve goes without them
+            remove_core_cut_constraints(model, opt, master_solver, pool_constraints.pop(key))
+        master_end_time = datetime.now()
+
+        requests = dict()
+        for day_name in sorted(master_requests.keys()):
+            requests[f"{day_name}"] = master_requests[day_name]
+
+        results = solve_subproblem(services, packets, operators, priorities, requests, args.method, False, args.workers, cache, args.heuristic_prepass, args.decompose, args.symmetry_breaking,
+            subproblem_solver)
+        subproblem_end_time = datetime.now()
+
+        cores = compute_cores(services, packets, operators, requests, results, subsumptions, args.restrict)
+        cores, duplicate_core_number, dominated_core_number = filter_cores(cores, args.expand_cores or args.aggregate_cores)
+        new_constraints = []
+        for cut in get_core_cuts(model, full_input, cores, args.expand_cores, args.aggregate_cores):
+            key = add_pool_cut(pool, cut)
+            if key is None: # already in the master
+                continue
+            pool_constraints[key] = add_core_cut(model, cut)
+            new_constraints.extend(pool_constraints[key])
+        cores_end_time = datetime.now()
+
+        requested_packets, scheduled_packets = count_packets(requests, results)
+        iteration = {
+            "masterObjective": value(model.objective),
+            "masterStatus": master_outcome["status"],
+            "masterBound": master_outcome["bound"],
+            "requestedPackets": requested_packets,
+            "scheduledPackets": scheduled_packets,
+            "cores": len(cores),
+            "removedCores": duplicate_core_number + dominated_core_number,
+            "newCuts": len(new_constraints),
+            "bindingCuts": binding_cut_number,
+            "evictedCuts": len(evicted_keys),
+            "poolSize": len(pool["cuts"]),
+            "cacheHits": cache["hits"] - hits,
+            "cacheMisses": cache["misses"] - misses,
+            "masterTime": (master_end_time - iteration_start_time).total_seconds(),
+            "subproblemTime": (subproblem_end_time - master_end_time).total_seconds(),
+            "coresTime": (cores_end_time - subproblem_end_time).total_seconds()
+        }
+        iterations.append(iteration)
+        if print_flag:
+            master_report = "" if master_outcome["status"] == "optimal" else f" ({get_outcome_report(master_outcome)})"
+            print(f"\n    iteration {len(iterations)}: master objective {iteration['masterObjective']}{master_report}, "
+                f"scheduled {scheduled_packets}/{requested_packets} packets, {len(cores)} cores ({iteration['removedCores']} removed), {len(new_constraints)} new cuts, "
+                f"{binding_cut_number}/{len(pool['cuts'])} binding pool cuts ({len(evicted_keys)} evicted), "
+                f"{iteration['cacheHits']} cached days "
+                f"(master {iteration['masterTime']}s, subproblem {iteration['subproblemTime']}s, cores {iteration['coresTime']}s)", end="")
+
+        if len(cores) == 0 or len(new_constraints) == 0:
+            break
+        if len(iterations) >= args.max_iterations:
+            break
+        if args.time_limit is not None and (datetime.now() - start_time).total_seconds() >= args.time_limit:
+            break
+
+    if print_flag:
+        print()
+
+    return requests, results, pool, iterations
+
+def process_instance(instance_path, args):
+    with open(os.path.join(instance_path, "full_input.json"), "r") as f:
+        full_input = json.load(f)
+    with open(os.path.join(instance_path, "services.json"), "r") as f:
+        services = json.load(f)
+    with open(os.path.join(instance_path, "packets.json"), "r") as f:
+        packets = json.load(f)
+    with open(os.path.join(instance_path, "operators.json"), "r") as f:
+        operators = json.load(f)
+    with open(os.path.join(instance_path, "priorities.json"), "r") as f:
+        priorities = json.load(f)
+    start_time = datetime.now()
+    if os.path.isfile(os.path.join(instance_path, "subsumptions.json")):
+        with open(os.path.join(instance_path, "subsumptions.json"), "r") as f:
+            subsumptions = json.load(f)
+    else:
+        subsumptions = compute_subsumptions(operators, "asp")
+    cache = None
+    candidate_days = None
+    if args.cache:
+        cache = load_cache(os.path.join(instance_path, "subproblem_cache.json"), args.cache_size)
+        candidate_days = get_candidate_days(full_input, os.path.join(instance_path, "candidate_days.json"))
+    requests, results, pool, iterations = solve_with_cores(full_input, services, packets, operators, priorities, subsumptions,
+        args, args.verbose and args.jobs <= 1, cache, candidate_days)
+    end_time = datetime.now()
+    if args.cache:
+        save_cache(cache, os.path.join(instance_path, "subproblem_cache.json"))
+    with open(os.path.join(instance_path, "requests.json"), "w") as f:
+        json.dump(requests, f, indent=4, sort_keys=True)
+    with open(os.path.join(instance_path, "results.json"), "w") as f:
+        json.dump(results, f, indent=4)
+    save_core_pool(pool, os.path.join(instance_path, "core_pool.json"))
+    with open(os.path.join(instance_path, "iterations.json"), "w") as f:
+        json.dump(iterations, f, indent=4)
+    return (end_time - start_time).total_seconds()
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Iterate master, subproblems and cores in a single process")
+    parser.add_argument("-m", "--method", metavar="MET", type=str, default="asp", choices=["asp", "milp_basic", "milp_optimized", "milp_epsilon", "milp_timeindexed", "heuristic"], help="subproblem solution method used (asp|milp_basic|milp_optimized|milp_epsilon|milp_timeindexed|heuristic)")
+    parser.add_argument("--heuristic-prepass", action="store_true", help="try the heuristic first, solving only the days it does not fully schedule")
+    parser.add_argument("-s", "--solver", metavar="SOL", type=str, default="gurobi", choices=[name for name, backend in solver_backends.items() if backend["persistent"] is not None], help="MILP solver used for the master (gurobi|highs)")
+    parser.add_argument("--master-time-limit", metavar="SEC", type=float, default=None, help="stop each master solve after these many seconds, keeping the best solution found")
+    parser.add_argument("--subproblem-solver", metavar="SOL", type=str, default="gurobi", choices=list(solver_backends.keys()), help="solver used by the MILP subproblem methods (gurobi|highs|cbc)")
+    parser.add_argument("--subproblem-time-limit", metavar="SEC", type=float, default=None, help="stop the MILP solve of each day after these many seconds, keeping the best schedule found")
+    parser.add_argument("--mip-gap", metavar="GAP", type=float, default=None, help="relative gap at which the master and subproblem MILP solves stop")
+    parser.add_argument("--threads", metavar="NUM", type=int, default=None, help="threads used by the MILP solvers")
+    parser.add_argument("-i", "--input", metavar="IN", type=str, default="instances", help="input folder with the instances")
+    parser.add_argument("-r", "--restrict", action="store_true", help="suppress core expansion to any less day")
+    parser.add_argument("--expand-cores", action="store_true", help="infer all information from cores")
+    parser.add_argument("--aggregate-cores", action="store_true", help="infer all information from cores with one compact cut per core day (overrides --expand-cores)")
+    parser.add_argument("--pool-max-size", metavar="NUM", type=int, default=None, help="maximum number of cuts kept in the master")
+    parser.add_argument("--pool-max-idle", metavar="NUM", type=int, default=5, help="only cuts not binding for these many iterations can be evicted")
+    parser.add_argument("--max-iterations", metavar="NUM", type=int, default=100, help="maximum number of master iterations")
+    parser.add_argument("--time-limit", metavar="SEC", type=float, default=None, help="no new iteration is started after this many seconds")
+    parser.add_argument("--symmetry-breaking", action="store_true", help="exclude the solutions equal to another one up to identical operators or patients")
+    parser.add_argument("--decompose", action="store_true", help="solve separately the groups of care units of each day not linked by any patient")
+    parser.add_argument("-w", "--workers", metavar="NUM", type=int, default=1, help="number of days solved in parallel")
+    parser.add_argument("-j", "--jobs", metavar="NUM", type=int, default=1, help="number of instances processed in parallel")
+    parser.add_argument("--cache", action="store_true", help="reuse and update the daily results and the master candidate days saved in each instance")
+    parser.add_argument("--cache-size", metavar="NUM", type=int, default=10000, help="maximum number of days kept in the cache")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show what is done")
+    args = parser.parse_args(sys.argv[1:])
+
+    if args.jobs > 1 and args.workers > 1:
+        parser.error("instance jobs and day workers cannot be both greater than 1")
+    if args.pool_max_idle < 1:
+        parser.error("--pool-max-idle must be at least 1")
+
+    instance_paths = get_instance_paths(get_folder_path(sys.argv[0], args.input))
+
+    instance_number = len(instance_paths)
+    if instance_number == 0:
+        print("No instance folder found. No action taken.")
+        exit(0)
+
+    total_time = run_on_instances(process_instance, instance_paths, args)
+
+    if args.verbose:
+        print(f"Solved with cores {instance_number} instance(s). Total time taken: {total_time}s, average: {total_time / instance_number}s")
@@ -0,0 +1,91 @@
+import math
+
+from pyomo.environ import SolverFactory, TerminationCondition, Objective, maximize, value
+from pyomo.opt import SolverStatus
+
+# solver -> one-shot pyomo solver, persistent pyomo solver (None if there is none) and names of its time limit, relative gap and thread options
+solver_backends = {
+    "gurobi": {"solver": "gurobi", "persistent": "gurobi_persistent", "timeLimit": "TimeLimit", "gap": "MIPGap", "threads": "Threads"},
+    "highs": {"solver": "appsi_highs", "persistent": "appsi_highs", "timeLimit": "time_limit", "gap": "mip_rel_gap", "threads": "threads"},
+    "cbc": {"solver": "cbc", "persistent": None, "timeLimit": "seconds", "gap": "ratio", "threads": "threads"}
+}
+
+# termination conditions of a search stopped before proving optimality or infeasibility
+limit_termination_conditions = (TerminationCondition.maxTimeLimit, TerminationCondition.maxIterations,
+    TerminationCondition.maxEvaluations, TerminationCondition.userInterrupt)
+
+# settings of the solves of a stage: time limit in seconds, relative gap and threads are left to the solver if None
+def get_solver_settings(solver_name="gurobi", time_limit=None, gap=None, threads=None):
+    return {
+        "solver": solver_name,
+        "timeLimit": time_limit,
+        "gap": gap,
+        "threads": threads
+    }
+
+def create_solver(settings, persistent=False):
+    backend = solver_backends[settings["solver"]]
+    if persistent and backend["persistent"] is None:
+        raise ValueError(f"solver '{settings['solver']}' has no persistent interface")
+    opt = SolverFactory(backend["persistent"] if persistent else backend["solver"])
+    for option in ("timeLimit", "gap", "threads"):
+        if settings[option] is not None:
+            opt.options[backend[option]] = settings[option]
+    return opt
+
+# status (optimal, limit, infeasible or the pyomo termination condition) and objective bound of a solve
+# whose solution is not loaded yet; the incumbent is filled once it is
+def get_solve_outcome(model, result):
+    termination_condition = result.solver.termination_condition
+    if termination_condition == TerminationCondition.optimal:
+        status = "optimal"
+    elif termination_condition in (TerminationCondition.infeasible, TerminationCondition.infeasibleOrUnbounded):
+        status = "infeasible"
+    elif termination_condition in limit_termination_conditions:
+        status = "limit"
+    else:
+        status = str(termination_condition)
+    objective = next(model.component_data_objects(Objective, active=True))
+    bound = result.problem.upper_bound if objective.sense == maximize else result.problem.lower_bound
+    if bound is None or not math.isfinite(bound):
+        bound = None
+    return {
+        "status": status,
+        "incumbent": None,
+        "bound": bound,
+        "hasSolution": status == "optimal" or (status != "infeasible" and len(result.solution) > 0)
+    }
+
+def set_incumbent(model, outcome):
+    objective = next(model.component_data_objects(Objective, active=True))
+    outcome["incumbent"] = value(objective)
+    if outcome["status"] == "optimal" and outcome["bound"] is None:
+        outcome["bound"] = outcome["incumbent"]
+
+# solve the model with the settings, loading the best solution found even if a limit stopped the search. Returns the outcome
+def solve_model(model, settings, warm_start=False):
+    opt = create_solver(settings)
+    if warm_start:
+        result = opt.solve(model, load_solutions=False, warmstart=True)
+    else:
+        result = opt.solve(model, load_solutions=False)
+    outcome = get_solve_outcome(model, result)
+    if outcome["hasSolution"]:
+        result.solver.status = SolverStatus.ok # a limit reached with an incumbent is not an error
+        model.solutions.load_from(result)
+        set_incumbent(model, outcome)
+    return outcome
+
+# solve again a model loaded in a persistent solver of create_solver. Returns the outcome
+def solve_persistent_model(model, opt):
+    result = opt.solve(model, load_solutions=False)
+    outcome = get_solve_outcome(model, result)
+    if outcome["hasSolution"]:
+        opt.load_vars()
+        set_incumbent(model, outcome)
+    return outcome
+
+def get_outcome_report(outcome):
+    if outcome["status"] == "optimal":
+        return "optimal"
+    return f"{outcome['status']}, incumbent {outcome['incumbent']}, bound {outcome['bound']}"
@@ -0,0 +1,65 @@
+import os
+import json
+import hashlib
+from collections import OrderedDict
+
+# canonical hash of everything a daily result depends on: the day's requests and operators,
+# the services, packets and priorities they refer to, and the solution method.
+# The day name itself is not part of the key, so equal days share their result.
+def get_day_key(day_name, services, packets, operators, priorities, requests, method):
+    daily_requests = requests[day_name]
+    packet_names = set()
+    for patient in daily_requests.values():
+        packet_names.update(patient["packets"])
+    service_names = set()
+    for packet_name in packet_names:
+        service_names.update(packets[packet_name])
+    content = {
+        "method": method,
+        "requests": daily_requests,
+        "operators": operators[day_name],
+        "services": {service_name: services[service_name] for service_name in service_names},
+        "packets": {packet_name: packets[packet_name] for packet_name in packet_names},
+        "priorities": {patient_name: priorities[patient_name] for patient_name in daily_requests.keys()}
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+# load the cache from file (an empty one if there is no file, or no path for an in-memory cache); at most max_size days are kept
+def load_cache(cache_path, max_size):
+    entries = OrderedDict()
+    if cache_path is not None and os.path.isfile(cache_path):
+        with open(cache_path, "r") as f:
+            for key, daily_results in json.load(f):
+                entries[key] = daily_results
+    cache = {
+        "entries": entries,
+        "maxSize": max_size,
+        "hits": 0,
+        "misses": 0
+    }
+    evict_cache_entries(cache)
+    return cache
+
+# save the cache entries, from the least to the most recently used
+def save_cache(cache, cache_path):
+    with open(cache_path, "w") as f:
+        json.dump(list(cache["entries"].items()), f, separators=(",", ":"))
+
+# return the cached daily results (None if missing), counting hits and misses
+def get_cached_day(cache, key):
+    if key not in cache["entries"]:
+        cache["misses"] += 1
+        return None
+    cache["hits"] += 1
+    cache["entries"].move_to_end(key)
+    return cache["entries"][key]
+
+def put_cached_day(cache, key, daily_results):
+    cache["entries"][key] = daily_results
+    cache["entries"].move_to_end(key)
+    evict_cache_entries(cache)
+
+# drop the least recently used entries until the size bound is respected
+def evict_cache_entries(cache):
+    while len(cache["entries"]) > cache["maxSize"]:
+        cache["entries"].popitem(last=False)
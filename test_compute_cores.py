@@ -0,0 +1,36 @@
+from compute_cores import filter_cores
+
+def get_core(days, patient_name):
+    return {
+        "days": days,
+        "multipackets": {
+            "srv00_srv01": {
+                "times": 1,
+                "services": ["srv00", "srv01"],
+                "actual": {
+                    patient_name: ["pkt00"]
+                }
+            }
+        },
+        "affectedCareUnits": ["cu00"]
+    }
+
+# the default cuts are one per actual patient: equal multipackets received by different patients are different cores
+def test_cores_with_different_patients_are_kept():
+    cores = {"core00": get_core(["0"], "pat00"), "core01": get_core(["0"], "pat01")}
+    kept_cores, duplicate_core_number, dominated_core_number = filter_cores(cores)
+    assert sorted(kept_cores.keys()) == ["core00", "core01"]
+    assert duplicate_core_number == 0 and dominated_core_number == 0
+
+def test_cores_with_same_patients_are_duplicates():
+    cores = {"core00": get_core(["0"], "pat00"), "core01": get_core(["0"], "pat00")}
+    kept_cores, duplicate_core_number, _ = filter_cores(cores)
+    assert sorted(kept_cores.keys()) == ["core00"]
+    assert duplicate_core_number == 1
+
+# the expanded and aggregated cuts ignore the patients, so one of the two cores is enough
+def test_dominance_ignores_patients():
+    cores = {"core00": get_core(["0"], "pat00"), "core01": get_core(["0"], "pat01")}
+    kept_cores, _, dominated_core_number = filter_cores(cores, remove_dominated=True)
+    assert len(kept_cores) == 1
+    assert dominated_core_number == 1
@@ -0,0 +1,10 @@
+from core_pool import create_core_pool, add_pool_cut, evict_pool_cuts
+
+# the cuts binding in the last solve stay in a full pool, whatever the idle limit
+def test_binding_cuts_are_not_evicted():
+    pool = create_core_pool()
+    binding_key = add_pool_cut(pool, ("list", [["pat00", "srv00", "0"], ["pat01", "srv00", "0"]]), binding=1, idle=0)
+    idle_key = add_pool_cut(pool, ("list", [["pat00", "srv01", "1"], ["pat01", "srv01", "1"]]), binding=0, idle=1)
+    evicted_keys = evict_pool_cuts(pool, 0, 0)
+    assert evicted_keys == [idle_key]
+    assert list(pool["cuts"].keys()) == [binding_key]
@@ -0,0 +1,74 @@
+import pytest
+from pyomo.environ import Constraint, value
+from pyomo.core.expr.visitor import identify_variables
+
+import solve_subproblems
+from solve_subproblems import solve_day_with_heuristic, solve_day_with_milp, solve_day_with_timeindexed_milp, remove_stray_services
+
+# one operator starting at 0 and two patients competing for it: the heuristic schedules only some packets
+services = {
+    "srv00": {"careUnit": "cu00", "duration": 3},
+    "srv01": {"careUnit": "cu00", "duration": 2}
+}
+packets = {
+    "pkt00": ["srv00", "srv01"],
+    "pkt01": ["srv01"]
+}
+operators = {"0": {"cu00": {"op00": {"start": 0, "duration": 6}}}}
+priorities = {"pat00": 2, "pat01": 1}
+requests = {"0": {
+    "pat00": {"packets": ["pkt00"]},
+    "pat01": {"packets": ["pkt00", "pkt01"]}
+}}
+
+def test_heuristic_never_starts_at_zero():
+    scheduled_services = solve_day_with_heuristic("0", services, packets, operators, priorities, requests)
+    assert len(scheduled_services) > 0
+    assert all(scheduled_service["start"] >= 1 for scheduled_service in scheduled_services)
+
+def get_model(monkeypatch, solve_day):
+    models = []
+    def solve_model(model, settings, warm_start=False):
+        models.append(model)
+        return {"status": "infeasible", "incumbent": None, "bound": None, "hasSolution": False}
+    monkeypatch.setattr(solve_subproblems, "solve_model", solve_model)
+    solve_day()
+    return models[0]
+
+# the pairwise variables are left to the solver, so only the constraints whose variables all have a value are checked
+@pytest.mark.parametrize("method", ["milp_basic", "milp_optimized", "milp_epsilon", "milp_timeindexed"])
+def test_warm_start_satisfies_milp_constraints(monkeypatch, method):
+    warm_start = solve_day_with_heuristic("0", services, packets, operators, priorities, requests)
+    if method == "milp_timeindexed":
+        model = get_model(monkeypatch, lambda: solve_day_with_timeindexed_milp("0", services, packets, operators, priorities, requests, warm_start))
+    else:
+        model = get_model(monkeypatch, lambda: solve_day_with_milp("0", services, packets, operators, priorities, requests, method, warm_start))
+
+    checked_constraint_number = 0
+    for constraint in model.component_data_objects(Constraint, active=True):
+        if any(variable.value is None for variable in identify_variables(constraint.body)):
+            continue
+        body = value(constraint.body)
+        assert constraint.lower is None or body >= value(constraint.lower) - 1e-6, constraint.name
+        assert constraint.upper is None or body <= value(constraint.upper) + 1e-6, constraint.name
+        checked_constraint_number += 1
+    assert checked_constraint_number > 0
+
+# a stray service (done without completing any of its packets) does not change the objective, so the model must forbid it
+def test_timeindexed_milp_forbids_stray_services(monkeypatch):
+    model = get_model(monkeypatch, lambda: solve_day_with_timeindexed_milp("0", services, packets, operators, priorities, requests))
+    for index in model.packet_indexes:
+        model.packet[index].set_value(0)
+    for index in model.x_indexes:
+        model.x[index].set_value(1)
+        constraint = model.x_and_packets[index]
+        assert value(constraint.body) > value(constraint.upper), constraint.name
+
+def test_stray_services_are_removed():
+    daily_scheduled_services = [
+        {"patient": "pat00", "service": "srv00", "operator": "op00", "care_unit": "cu00", "start": 1},
+        {"patient": "pat00", "service": "srv01", "operator": "op00", "care_unit": "cu00", "start": 4},
+        {"patient": "pat01", "service": "srv00", "operator": "op00", "care_unit": "cu00", "start": 6}
+    ]
+    kept_services = remove_stray_services("0", packets, requests, daily_scheduled_services)
+    assert kept_services == daily_scheduled_services[:2]
@@ -0,0 +1,174 @@
+import os
+import sys
+import json
+import argparse
+from datetime import datetime
+
+import numpy as np
+
+from instance_runner import get_folder_path, get_instance_paths, run_on_instances
+
+# packets of the day not entirely scheduled and operators with nothing to do, in the results format
+def analyze_day(day_name, packets, operators, requests, daily_scheduled_services):
+    done_services = set((scheduled_service["patient"], scheduled_service["service"]) for scheduled_service in daily_scheduled_services)
+    used_operators = set((scheduled_service["care_unit"], scheduled_service["operator"]) for scheduled_service in daily_scheduled_services)
+
+    not_scheduled_packets = dict()
+    for patient_name, patient in requests[day_name].items():
+        packet_names = [packet_name for packet_name in patient["packets"]
+            if any((patient_name, service_name) not in done_services for service_name in packets[packet_name])]
+        if len(packet_names) > 0:
+            not_scheduled_packets[patient_name] = sorted(packet_names)
+
+    unused_operators = dict()
+    for care_unit_name, care_unit in operators[day_name].items():
+        operator_names = [operator_name for operator_name in care_unit.keys() if (care_unit_name, operator_name) not in used_operators]
+        if len(operator_names) > 0:
+            unused_operators[care_unit_name] = operator_names
+
+    return not_scheduled_packets, unused_operators
+
+# pairs of rows overlapping in time inside the same group: after sorting by group and start,
+# an interval overlapping some later one of its group overlaps the next one too
+def get_overlapping_rows(group_ids, starts, ends):
+    order = np.lexsort((starts, group_ids))
+    sorted_groups = group_ids[order]
+    is_overlapping = (sorted_groups[1:] == sorted_groups[:-1]) & (starts[order][1:] < ends[order][:-1])
+    indexes = np.flatnonzero(is_overlapping)
+    return list(zip(order[indexes].tolist(), order[indexes + 1].tolist()))
+
+# check the results of a whole instance at once, returning day -> list of error messages (only days with errors).
+# Services must be requested, done once and part of a completed packet, inside the window of an existing operator
+# of their care unit, without operator or patient overlaps; notScheduledPackets and unusedOperators must be consistent with the schedule
+def validate_results(services, packets, operators, requests, results):
+    errors = dict()
+    def add_error(day_name, message):
+        if day_name not in errors:
+            errors[day_name] = []
+        errors[day_name].append(message)
+
+    rows = [] # (day, scheduled service) of every schedulable service
+    operator_keys = dict() # (day, care unit, operator) -> group id
+    patient_keys = dict() # (day, patient) -> group id
+    row_operators = []
+    row_patients = []
+    row_starts = []
+    row_ends = []
+    operator_starts = []
+    operator_ends = []
+
+    for day_name, daily_results in results.items():
+        daily_requests = requests.get(day_name, dict())
+        requested_services = set()
+        for patient_name, patient in daily_requests.items():
+            for packet_name in patient["packets"]:
+                for service_name in packets[packet_name]:
+                    requested_services.add((patient_name, service_name))
+        done_services = set()
+        for scheduled_service in daily_results["scheduledServices"]:
+            patient_name = scheduled_service["patient"]
+            service_name = scheduled_service["service"]
+            care_unit_name = scheduled_service["care_unit"]
+            operator_name = scheduled_service["operator"]
+            description = f"service '{service_name}' of patient '{patient_name}'"
+            if (patient_name, service_name) not in requested_services:
+                add_error(day_name, f"{description} is not requested")
+            if (patient_name, service_name) in done_services:
+                add_error(day_name, f"{description} is done more than once")
+            done_services.add((patient_name, service_name))
+            if service_name not in services or services[service_name]["careUnit"] != care_unit_name:
+                add_error(day_name, f"{description} is not of care unit '{care_unit_name}'")
+                continue
+            if care_unit_name not in operators.get(day_name, dict()) or operator_name not in operators[day_name][care_unit_name]:
+                add_error(day_name, f"{description} has no operator '{operator_name}' in care unit '{care_unit_name}'")
+                continue
+            operator = operators[day_name][care_unit_name][operator_name]
+            rows.append((day_name, scheduled_service))
+            row_operators.append(operator_keys.setdefault((day_name, care_unit_name, operator_name), len(operator_keys)))
+            row_patients.append(patient_keys.setdefault((day_name, patient_name), len(patient_keys)))
+            row_starts.append(scheduled_service["start"])
+            row_ends.append(scheduled_service["start"] + services[service_name]["duration"])
+            operator_starts.append(operator["start"])
+            operator_ends.append(operator["start"] + operator["duration"])
+
+        # a service counts only if it completes some requested packet of its patient
+        for patient_name, service_name in sorted(done_services & requested_services):
+            if not any(service_name in packets[packet_name] and all((patient_name, other_service_name) in done_services for other_service_name in packets[packet_name])
+                    for packet_name in daily_requests[patient_name]["packets"]):
+                add_error(day_name, f"service '{service_name}' of patient '{patient_name}' belongs to no completed packet")
+
+        if day_name in requests:
+            not_scheduled_packets, unused_operators = analyze_day(day_name, packets, operators, requests, daily_results["scheduledServices"])
+            if not_scheduled_packets != daily_results["notScheduledPackets"]:
+                add_error(day_name, f"notScheduledPackets should be {not_scheduled_packets}")
+            if unused_operators != daily_results["unusedOperators"]:
+                add_error(day_name, f"unusedOperators should be {unused_operators}")
+        else:
+            add_error(day_name, "day not requested")
+
+    for day_name in requests.keys():
+        if day_name not in results:
+            add_error(day_name, "day without results")
+
+    if len(rows) == 0:
+        return errors
+
+    row_starts = np.array(row_starts, dtype=np.int64)
+    row_ends = np.array(row_ends, dtype=np.int64)
+    is_outside = (row_starts < np.array(operator_starts, dtype=np.int64)) | (row_ends > np.array(operator_ends, dtype=np.int64))
+    for index in np.flatnonzero(is_outside).tolist():
+        day_name, scheduled_service = rows[index]
+        add_error(day_name, f"service '{scheduled_service['service']}' of patient '{scheduled_service['patient']}' is outside the window of operator '{scheduled_service['operator']}'")
+
+    for index1, index2 in get_overlapping_rows(np.array(row_operators, dtype=np.int64), row_starts, row_ends):
+        day_name, scheduled_service1 = rows[index1]
+        _, scheduled_service2 = rows[index2]
+        add_error(day_name, f"operator '{scheduled_service1['operator']}' of care unit '{scheduled_service1['care_unit']}' overlaps services "
+            f"'{scheduled_service1['service']}' of '{scheduled_service1['patient']}' and '{scheduled_service2['service']}' of '{scheduled_service2['patient']}'")
+
+    for index1, index2 in get_overlapping_rows(np.array(row_patients, dtype=np.int64), row_starts, row_ends):
+        day_name, scheduled_service1 = rows[index1]
+        _, scheduled_service2 = rows[index2]
+        add_error(day_name, f"patient '{scheduled_service1['patient']}' overlaps services '{scheduled_service1['service']}' and '{scheduled_service2['service']}'")
+
+    return errors
+
+def process_instance(instance_path, args):
+    with open(os.path.join(instance_path, "services.json"), "r") as f:
+        services = json.load(f)
+    with open(os.path.join(instance_path, "packets.json"), "r") as f:
+        packets = json.load(f)
+    with open(os.path.join(instance_path, "operators.json"), "r") as f:
+        operators = json.load(f)
+    with open(os.path.join(instance_path, "requests.json"), "r") as f:
+        requests = json.load(f)
+    with open(os.path.join(instance_path, "results.json"), "r") as f:
+        results = json.load(f)
+    start_time = datetime.now()
+    errors = validate_results(services, packets, operators, requests, results)
+    end_time = datetime.now()
+    with open(os.path.join(instance_path, "validation.json"), "w") as f:
+        json.dump(errors, f, indent=4)
+    if args.verbose and args.jobs <= 1:
+        print(f"({sum(len(day_errors) for day_errors in errors.values())} errors)", end=" ")
+    return (end_time - start_time).total_seconds()
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Check the feasibility of the instances results")
+    parser.add_argument("-i", "--input", metavar="IN", type=str, default="instances", help="input folder with the instances")
+    parser.add_argument("-j", "--jobs", metavar="NUM", type=int, default=1, help="number of instances processed in parallel")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show what is done")
+    args = parser.parse_args(sys.argv[1:])
+
+    instance_paths = get_instance_paths(get_folder_path(sys.argv[0], args.input))
+
+    instance_number = len(instance_paths)
+    if instance_number == 0:
+        print("No instance folder found. No action taken.")
+        exit(0)
+
+    total_time = run_on_instances(process_instance, instance_paths, args)
+
+    if args.verbose:
+        print(f"Validated {instance_number} instance(s). Total time taken: {total_time}s, average: {total_time / instance_number}s")